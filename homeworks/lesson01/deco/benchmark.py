@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Overhead of instrumentation decorators per call, turned on and off.
+
+Usage:
+    python -m homeworks.lesson01.deco.benchmark [--number N]
+"""
+import argparse
+import timeit
+
+from homeworks.lesson01.deco import deco
+
+DEFAULT_NUMBER = 1000000
+
+DECORATORS = [
+    ('countcalls', lambda: deco.countcalls),
+    ('profile', lambda: deco.profile(registry=deco.ProfileRegistry())),
+    ('trace', lambda: deco.trace(size=1000)),
+    ('trace sample=100', lambda: deco.trace(size=1000, sample=100)),
+]
+
+
+def target(x):
+    return x
+
+
+def call_time(func, number):
+    '''Time of a call, ns'''
+    return timeit.timeit(lambda: func(1), number=number) / number * 1e9
+
+
+def run(number=DEFAULT_NUMBER):
+    '''List of (decorator, overhead on, overhead off), ns per call'''
+    enabled = deco.INSTRUMENTATION
+    base = call_time(target, number)
+    results = []
+    try:
+        for name, make in DECORATORS:
+            overhead = []
+            for on in (True, False):
+                deco.set_instrumentation(on)
+                overhead.append(call_time(make()(target), number) - base)
+            results.append((name, *overhead))
+    finally:
+        deco.set_instrumentation(enabled)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='benchmark.py')
+    parser.add_argument('--number', type=int, default=DEFAULT_NUMBER, help='Calls per measurement')
+    args = parser.parse_args()
+
+    print(f'{"decorator":<20}{"on, ns":>10}{"off, ns":>10}')
+    for name, on, off in run(args.number):
+        print(f'{name:<20}{on:>10.0f}{off:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,60 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from collections import Counter
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import hashlib
+import importlib
+import inspect
+import itertools
+import json
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from multiprocessing import shared_memory
 
+_MISSING = object()  # no entry in the cache (None is a valid cached result)
 
-def disable():
+KEY_PROTOCOL = 4  # fixed pickle protocol: the same arguments give the same key in any process
+
+CacheInfo = namedtuple('CacheInfo', 'hits misses evictions size maxsize')
+
+
+DISABLE_ENV = 'DECO_DISABLE'  # DECO_DISABLE=1 turns instrumentation decorators off
+INSTRUMENTATION = os.environ.get(DISABLE_ENV, '') in ('', '0')
+
+
+def set_instrumentation(enabled):
+    '''
+    Turn instrumentation decorators (countcalls, profile, trace)
+    on or off. Off, they return the function decorated unchanged,
+    without a wrapper. Applies to functions decorated afterwards,
+    so call it before importing the instrumented modules.
+    '''
+    global INSTRUMENTATION
+    INSTRUMENTATION = enabled
+
+
+def disable(func=None, *args, **kwargs):
     '''
     Disable a decorator by re-assigning the decorator's name
     to this function. For example, to turn off memoization:
 
     >>> memo = disable
 
+    The function decorated is returned unchanged. Decorators with
+    arguments are disabled the same way: trace = disable makes
+    @trace("####") a no-op too.
     '''
-    return
+    if callable(func) and not args and not kwargs:
+        return func
+    return disable
 
 
 def decorator():
@@ -22,53 +65,704 @@ def decorator():
     return
 
 
+@functools.total_ordering
+class CallCounter(object):
+    '''
+    Number of calls, changed in place. Decorators copy attributes of
+    the function they wrap, so a plain int would be copied once and
+    never update in the outer wrappers.
+
+    Behaves as an int in arithmetic, comparisons and formatting; the
+    int itself is in .value (e.g. for json.dumps).
+    '''
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def __iadd__(self, n):
+        self.value += n
+        return self
+
+    def __int__(self):
+        return self.value
+
+    __index__ = __int__
+
+    def __float__(self):
+        return float(self.value)
+
+    def __bool__(self):
+        return bool(self.value)
+
+    def __add__(self, other):
+        return self.value + other
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self.value - other
+
+    def __rsub__(self, other):
+        return other - self.value
+
+    def __eq__(self, other):
+        return self.value == other
+
+    def __lt__(self, other):
+        return self.value < other
+
+    __hash__ = None  # mutable
+
+    def __format__(self, spec):
+        return format(self.value, spec)
+
+    def __repr__(self):
+        return str(self.value)
+
+
 def countcalls(func):
-    '''Decorator that counts calls made to the function decorated.'''
-    _counter = Counter()
+    '''Decorator that counts calls made to the function decorated.
+    With instrumentation off there is no wrapper and no .calls.'''
+    if not INSTRUMENTATION:
+        return func
+    calls = CallCounter()
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args):
+            wrapper.calls += 1
+            return await func(*args)
+    else:
+        @functools.wraps(func)
+        def wrapper(*args):
+            wrapper.calls += 1
+            return func(*args)
 
-    def wrapper(*args):
-        _counter[func] += 1
-        return func(*args)
+    wrapper.calls = calls
+    return wrapper
+
+
+class FuncStats(object):
+    '''Statistics of calls of a profiled function, times in nanoseconds'''
+
+    BUCKETS = 64  # bucket n counts calls lasting from 2 ** (n - 1) to 2 ** n ns
+
+    __slots__ = ('name', 'calls', 'total', 'self_time', 'histogram')
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total = 0  # cumulative time, recursive calls are counted once
+        self.self_time = 0  # time without calls of other profiled functions
+        self.histogram = [0] * self.BUCKETS
+
+    def reset(self):
+        '''Clears counters in place: wrappers keep references to them'''
+        self.calls = self.total = self.self_time = 0
+        self.histogram[:] = [0] * self.BUCKETS
+
+    def percentile(self, q):
+        '''Upper bound of the histogram bucket holding q-th percentile of call durations, ns'''
+        rank = q / 100 * self.calls
+        seen = 0
+        for n, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= rank:
+                return 1 << n
+        return 0
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'calls': self.calls,
+            'total_ns': self.total,
+            'self_ns': self.self_time,
+            'mean_ns': self.total // self.calls if self.calls else 0,
+            'p50_ns': self.percentile(50),
+            'p99_ns': self.percentile(99),
+            'histogram': {1 << n: count for n, count in enumerate(self.histogram) if count},
+        }
+
+
+class ProfileRegistry(object):
+    '''Statistics of all functions decorated with profile'''
+
+    def __init__(self):
+        self.stats = {}
+
+    def get(self, name):
+        if name not in self.stats:
+            self.stats[name] = FuncStats(name)
+        return self.stats[name]
+
+    def to_dict(self):
+        return {name: st.to_dict() for name, st in self.stats.items()}
 
-    wrapper.calls = _counter[func]
+    def dump_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def dump_text(self):
+        '''Table sorted by cumulative time, times in microseconds'''
+        lines = [f'{"function":<40}{"calls":>10}{"total":>12}{"self":>12}{"p50":>10}{"p99":>10}']
+        for st in sorted(self.stats.values(), key=lambda st: st.total, reverse=True):
+            lines.append(f'{st.name:<40}{st.calls:>10}{st.total / 1000:>12.1f}{st.self_time / 1000:>12.1f}'
+                         f'{st.percentile(50) / 1000:>10.1f}{st.percentile(99) / 1000:>10.1f}')
+        return '\n'.join(lines)
+
+    def reset(self):
+        for st in self.stats.values():
+            st.reset()
+
+
+class _ProfileLocal(threading.local):
+    '''Per thread state of profiled calls in progress'''
+
+    def __init__(self):
+        # a stack of child time of calls in progress and {FuncStats: calls in progress} to count
+        # recursion once, in one tuple to look them up with one attribute access
+        self.state = ([], {})
+
+
+profiler = ProfileRegistry()
+_profile_local = _ProfileLocal()
+
+
+def profile(func=None, registry=None):
+    '''
+    Decorator that profiles the function decorated: number of calls,
+    cumulative and self time and a histogram of call durations with
+    power of two buckets. Statistics are kept in wrapper.stats and in
+    the registry (profiler by default), which dumps them as a text
+    table or JSON.
+
+    Calls of coroutine functions interleave, so their self time is
+    the same as the cumulative one, and recursion is not detected.
+    '''
+    if func is None:
+        return functools.partial(profile, registry=registry)
+    if not INSTRUMENTATION:
+        return func
+    stats = (registry or profiler).get(f'{func.__module__}.{func.__qualname__}')
+    clock = time.perf_counter_ns
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args):
+            start = clock()
+            try:
+                return await func(*args)
+            finally:
+                elapsed = clock() - start
+                stats.calls += 1
+                stats.total += elapsed
+                stats.self_time += elapsed
+                stats.histogram[elapsed.bit_length()] += 1
+    else:
+        local = _profile_local
+        histogram = stats.histogram
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            stack, depth = local.state
+            level = depth.get(stats, 0)
+            depth[stats] = level + 1
+            stack.append(0)
+            start = clock()
+            try:
+                return func(*args)
+            finally:
+                elapsed = clock() - start
+                depth[stats] = level
+                child = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                stats.calls += 1
+                if not level:
+                    stats.total += elapsed
+                stats.self_time += elapsed - child
+                histogram[elapsed.bit_length()] += 1
+
+    wrapper.stats = stats
     return wrapper
 
 
-def memo(func):
+class LRUCache(object):
+    '''
+    In-memory cache with an optional bound on the number of entries
+    (least recently used entries are evicted first) and an optional
+    time to live of each entry in seconds.
+    '''
+
+    def __init__(self, maxsize=None, ttl=None, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.hits = self.misses = self.evictions = 0
+        self._data = OrderedDict()  # key -> (value, expiration time or None)
+
+    def get(self, key):
+        '''Cached value or _MISSING'''
+        entry = self._data.get(key, _MISSING)
+        if entry is not _MISSING:
+            value, expires = entry
+            if expires is None or self.timer() < expires:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+            self.evictions += 1
+        self.misses += 1
+        return _MISSING
+
+    def set(self, key, value):
+        expires = None if self.ttl is None else self.timer() + self.ttl
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        if self.maxsize is not None and len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.evictions, len(self._data), self.maxsize)
+
+    def clear(self):
+        self._data.clear()
+        self.hits = self.misses = self.evictions = 0
+
+
+def args_digest(args):
+    '''Stable across processes SHA-256 digest of pickled arguments'''
+    return hashlib.sha256(pickle.dumps(args, protocol=KEY_PROTOCOL)).digest()
+
+
+class SqliteCache(object):
+    '''
+    Persistent cache in an SQLite file, shared by processes and kept
+    between restarts. Keys are SHA-256 hashes of the pickled arguments
+    (so arguments must pickle deterministically: numbers, strings,
+    tuples...), values are pickled. maxsize bounds the number of
+    entries of the namespace, least recently used are evicted. To keep
+    hits read-only, the last use time is rewritten only when it is older
+    than used_granularity seconds, so recency is tracked with that
+    precision. Several functions can share one file with different
+    namespaces; memo sets the namespace to the module and the name of
+    the function when none is given, so functions with the same
+    arguments do not read each other's results.
+    '''
+
+    def __init__(self, path, maxsize=None, ttl=None, namespace=None, timeout=30., used_granularity=1.):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.namespace = namespace
+        self.timeout = timeout  # seconds to wait for a lock held by another process
+        self.used_granularity = used_granularity
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connect(self):
+        # a connection must not be shared with a forked child
+        if self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # in WAL mode NORMAL keeps the file consistent, a power loss may only drop the last entries
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS memo (ns TEXT NOT NULL, key BLOB NOT NULL, value BLOB NOT NULL, '
+                         'expires REAL, used REAL NOT NULL, PRIMARY KEY (ns, key))')
+            conn.execute('CREATE INDEX IF NOT EXISTS memo_used ON memo (ns, used)')
+            self._conn, self._pid = conn, os.getpid()
+        if self.namespace is None:  # used without memo
+            self.namespace = ''
+        return self._conn
+
+    def get(self, key):
+        '''Cached value or _MISSING'''
+        key = args_digest(key)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute('SELECT value, expires, used FROM memo WHERE ns = ? AND key = ?',
+                               (self.namespace, key)).fetchone()
+            if row is not None:
+                value, expires, used = row
+                if expires is None or now < expires:
+                    if self.maxsize is not None and now - used >= self.used_granularity:
+                        conn.execute('UPDATE memo SET used = ? WHERE ns = ? AND key = ?', (now, self.namespace, key))
+                    self.hits += 1
+                    return pickle.loads(value)
+                conn.execute('DELETE FROM memo WHERE ns = ? AND key = ?', (self.namespace, key))
+                self.evictions += 1
+            self.misses += 1
+            return _MISSING
+
+    def set(self, key, value):
+        key = args_digest(key)
+        value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        expires = None if self.ttl is None else now + self.ttl
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute('INSERT OR REPLACE INTO memo VALUES (?, ?, ?, ?, ?)',
+                             (self.namespace, key, value, expires, now))
+                if self.maxsize is not None:
+                    cursor = conn.execute('DELETE FROM memo WHERE ns = ? AND key IN (SELECT key FROM memo WHERE ns = ? '
+                                          'ORDER BY used DESC LIMIT -1 OFFSET ?)',
+                                          (self.namespace, self.namespace, self.maxsize))
+                    self.evictions += cursor.rowcount
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+    def info(self):
+        with self._lock:
+            size = self._connect().execute('SELECT COUNT(*) FROM memo WHERE ns = ?', (self.namespace,)).fetchone()[0]
+        return CacheInfo(self.hits, self.misses, self.evictions, size, self.maxsize)
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute('DELETE FROM memo WHERE ns = ?', (self.namespace,))
+            self.hits = self.misses = self.evictions = 0
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = self._pid = None
+
+
+class SharedMemoryCache(object):
+    '''
+    Cache in a fixed-size open-addressing hash table placed in
+    multiprocessing.shared_memory, shared by worker processes without
+    IPC: create it before forking workers (or pass it to spawned ones).
+
+    A slot holds a version, a 16-byte digest of the arguments, the
+    length of the pickled value and value_size bytes for it; values
+    that do not fit are not cached. A key is looked up in max_probe
+    slots starting from its hash; when they are all taken, the first
+    one is overwritten, so entries are never deleted and lookups stop
+    at the first empty slot.
+
+    Writers are serialized by a multiprocessing.Lock, readers take no
+    lock: the version is odd while a slot is being written and changes
+    after every write, a value read between two different versions is
+    treated as a miss.
+    '''
+
+    KEY_SIZE = 16
+    VERSION = struct.Struct('<I')  # 0 - empty slot, odd - being written
+    MAX_VERSION = 0xfffffffe
+    ENTRY = struct.Struct(f'<{KEY_SIZE}sI')  # key digest, value length
+    SLOT_HEADER_SIZE = VERSION.size + ENTRY.size
+
+    def __init__(self, slots=4096, value_size=240, max_probe=8, name=None, context=None):
+        self.slots = slots
+        self.value_size = value_size
+        self.max_probe = min(max_probe, slots)
+        self.slot_size = self.SLOT_HEADER_SIZE + value_size
+        self.hits = self.misses = self.evictions = self.oversized = 0
+        self._lock = (context or multiprocessing).Lock()  # context must match the one of worker processes
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=slots * self.slot_size)
+        self._owner = True
+
+    def __getstate__(self):
+        return {'slots': self.slots, 'value_size': self.value_size, 'max_probe': self.max_probe,
+                'lock': self._lock, 'name': self._shm.name}
+
+    def __setstate__(self, state):
+        self.slots = state['slots']
+        self.value_size = state['value_size']
+        self.max_probe = state['max_probe']
+        self.slot_size = self.SLOT_HEADER_SIZE + self.value_size
+        self.hits = self.misses = self.evictions = self.oversized = 0
+        self._lock = state['lock']
+        self._shm = _attach_shared_memory(state['name'])
+        self._owner = False
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def _offsets(self, key):
+        start = int.from_bytes(key[:8], 'little') % self.slots
+        for i in range(self.max_probe):
+            yield ((start + i) % self.slots) * self.slot_size
+
+    def get(self, key):
+        '''Cached value or _MISSING'''
+        key = args_digest(key)[:self.KEY_SIZE]
+        buf = self._shm.buf
+        for offset in self._offsets(key):
+            version = self.VERSION.unpack_from(buf, offset)[0]
+            if not version:
+                break  # empty slot: the key is not in the table
+            slot_key, length = self.ENTRY.unpack_from(buf, offset + self.VERSION.size)
+            if slot_key != key:
+                continue
+            start = offset + self.SLOT_HEADER_SIZE
+            value = bytes(buf[start:start + length])
+            if version & 1 or self.VERSION.unpack_from(buf, offset)[0] != version:
+                break  # the slot is being rewritten
+            self.hits += 1
+            return pickle.loads(value)
+        self.misses += 1
+        return _MISSING
+
+    def set(self, key, value):
+        key = args_digest(key)[:self.KEY_SIZE]
+        value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(value) > self.value_size:
+            self.oversized += 1
+            return
+        buf = self._shm.buf
+        with self._lock:
+            target = None
+            for offset in self._offsets(key):
+                version = self.VERSION.unpack_from(buf, offset)[0]
+                if not version or self.ENTRY.unpack_from(buf, offset + self.VERSION.size)[0] == key:
+                    target = offset
+                    break
+            if target is None:
+                target = next(self._offsets(key))
+                self.evictions += 1
+            version = self.VERSION.unpack_from(buf, target)[0]
+            self.VERSION.pack_into(buf, target, version + 1)  # odd: being written
+            self.ENTRY.pack_into(buf, target + self.VERSION.size, key, len(value))
+            start = target + self.SLOT_HEADER_SIZE
+            buf[start:start + len(value)] = value
+            self.VERSION.pack_into(buf, target, version + 2 if version < self.MAX_VERSION else 2)
+
+    def info(self):
+        buf = self._shm.buf
+        size = sum(1 for i in range(self.slots) if self.VERSION.unpack_from(buf, i * self.slot_size)[0])
+        return CacheInfo(self.hits, self.misses, self.evictions, size, self.slots)
+
+    def clear(self):
+        with self._lock:
+            self._shm.buf[:self.slots * self.slot_size] = bytes(self.slots * self.slot_size)
+        self.hits = self.misses = self.evictions = self.oversized = 0
+
+    def close(self):
+        '''Detaches the table; the creator also frees it'''
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def _attach_shared_memory(name):
+    '''Attaches to an existing segment. The segment stays registered
+    only with the resource tracker of its creator (worker processes
+    share the tracker of the parent), which frees it if leaked'''
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # python < 3.13: registration is repeated in the shared tracker
+        return shared_memory.SharedMemory(name=name)
+
+
+def memo(func=None, maxsize=None, ttl=None, thread_safe=False, cache=None):
     '''
     Memoize a function so that it caches all return values for
     faster future lookups.
-    '''
-    _cache = {}
 
-    def wrapper(*args):
-        r = _cache.get(args, None)
-        if r is None:
-            r = func(*args)
-            _cache[args] = r
-        return r
+    Use as @memo or with options @memo(maxsize=128, ttl=60):
+    maxsize bounds the number of cached results (least recently
+    used are evicted), ttl is a lifetime of a result in seconds.
+    Statistics are available via wrapper.cache_info().
+
+    With thread_safe=True concurrent calls with the same arguments
+    are computed once: the first caller computes, the others wait
+    for its result. An exception is raised in all of them and is
+    not cached.
 
+    For a coroutine function awaited results are cached, concurrent
+    awaits with the same arguments share one task.
+
+    cache replaces the in-memory LRUCache with another storage having
+    the same get/set/info/clear methods, e.g. a persistent one:
+
+    >>> @memo(cache=SqliteCache('/tmp/memo.sqlite', maxsize=10000))
+    '''
+    if func is None:
+        return functools.partial(memo, maxsize=maxsize, ttl=ttl, thread_safe=thread_safe, cache=cache)
+    if cache is None:
+        cache = LRUCache(maxsize, ttl)
+    elif getattr(cache, 'namespace', '') is None:
+        cache.namespace = f'{func.__module__}.{func.__qualname__}'
+
+    if inspect.iscoroutinefunction(func):
+        in_flight = {}  # args -> Task of the call being awaited
+
+        def done(args, task):
+            del in_flight[args]
+            if not task.cancelled() and task.exception() is None:
+                cache.set(args, task.result())
+
+        @functools.wraps(func)
+        async def wrapper(*args):
+            r = cache.get(args)
+            if r is not _MISSING:
+                return r
+            task = in_flight.get(args)
+            if task is None:
+                task = in_flight[args] = asyncio.ensure_future(func(*args))
+                task.add_done_callback(functools.partial(done, args))
+            # shield: cancellation of one caller doesn't cancel the shared task
+            return await asyncio.shield(task)
+    elif not thread_safe:
+        @functools.wraps(func)
+        def wrapper(*args):
+            r = cache.get(args)
+            if r is _MISSING:
+                r = func(*args)
+                cache.set(args, r)
+            return r
+    else:
+        lock = threading.Lock()
+        in_flight = {}  # args -> Future of the call being computed
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            with lock:
+                r = cache.get(args)
+                if r is not _MISSING:
+                    return r
+                future = in_flight.get(args)
+                owner = future is None
+                if owner:
+                    future = in_flight[args] = concurrent.futures.Future()
+            if not owner:
+                return future.result()
+
+            # the future is resolved and the call is no longer in flight whatever fails,
+            # func or cache.set (e.g. an unpicklable result), otherwise waiters block forever
+            try:
+                r = func(*args)
+                with lock:
+                    cache.set(args, r)
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            else:
+                future.set_result(r)
+            finally:
+                with lock:
+                    del in_flight[args]
+            return r
+
+    wrapper.cache_info = cache.info
+    wrapper.cache_clear = cache.clear
     return wrapper
 
 
-def n_ary(func):
+def _tree_reduce(func, items):
+    '''Reduces items by a binary associative function combining
+    neighbours pairwise: linear work, logarithmic depth'''
+    items = list(items)
+    while len(items) > 1:
+        pairs = [func(items[i], items[i + 1]) for i in range(0, len(items) - 1, 2)]
+        if len(items) % 2:
+            pairs.append(items[-1])
+        items = pairs
+    return items[0]
+
+
+_pools = {}  # workers: (pid, pool), pools of n_ary, one per number of workers
+_pools_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    '''Process pool shared by n_ary functions, created on first use.
+    A forked child does not reuse the parent's pool'''
+    with _pools_lock:
+        pid, pool = _pools.get(workers, (None, None))
+        if pid != os.getpid():
+            pool = concurrent.futures.ProcessPoolExecutor(workers)
+            _pools[workers] = os.getpid(), pool
+        return pool
+
+
+def _reduce_chunk(module, qualname, items):
+    '''Reduces a chunk in a worker process. The function is looked up
+    by name: the name may refer to the n_ary wrapper, possibly decorated
+    further (its binary function is in the .binary attribute, which
+    functools.wraps copies to the outer wrappers), or to the binary
+    function itself when called as n_ary(add, workers=...)'''
+    obj = importlib.import_module(module)
+    for name in qualname.split('.'):
+        obj = getattr(obj, name)
+    return _tree_reduce(getattr(obj, 'binary', obj), items)
+
+
+def n_ary(func=None, associative=False, workers=None, min_parallel=10000):
     '''
     Given binary function f(x, y), return an n_ary function such
     that f(x, y, z) = f(x, f(y,z)), etc. Also allow f(x) = x.
+
+    With associative=True arguments are reduced by a balanced tree
+    f(f(x, y), f(z, t)), which keeps the operands of the same size
+    (e.g. for products of big numbers or concatenations). If workers
+    is set, lists of at least min_parallel arguments are split into
+    chunks reduced in a pool of processes. The function must be defined
+    at module level, the arguments must be picklable. The pool is
+    created by the first parallel call and reused; its startup (tens of
+    milliseconds) and pickling of the arguments are what min_parallel
+    should outweigh.
     '''
+    if func is None:
+        return functools.partial(n_ary, associative=associative, workers=workers, min_parallel=min_parallel)
+    # workers look the function up by name: lambdas and local functions have no importable one
+    if workers is not None and '<' in func.__qualname__:
+        raise ValueError(f'n_ary with workers needs a named module level function, got {func.__qualname__}')
 
+    @functools.wraps(func)
     def wrapper(*args):
-        if len(args) == 1:
-            return args[0]
+        if not args:
+            raise TypeError(f'{func.__name__}() needs at least one argument')
         if len(args) == 2:
             return func(*args)
-        *s, x, y = args
-        return wrapper(*s, func(x, y))
-
+        if not associative:
+            r = args[-1]
+            for i in range(len(args) - 2, -1, -1):
+                r = func(args[i], r)
+            return r
+        if workers is None or len(args) < min_parallel:
+            return _tree_reduce(func, args)
+
+        size = -(-len(args) // (workers * 4))
+        chunks = [args[i:i + size] for i in range(0, len(args), size)]
+        n = len(chunks)
+        results = _get_pool(workers).map(_reduce_chunk, [func.__module__] * n, [func.__qualname__] * n, chunks)
+        return _tree_reduce(func, list(results))
+
+    wrapper.binary = func
     return wrapper
 
 
-def trace(func):
+TraceEvent = namedtuple('TraceEvent', 'kind depth call result duration')  # duration in ns
+
+
+def format_trace(events, prefix='', durations=False):
+    '''Indented tree of trace events, one line per event'''
+    lines = []
+    for e in events:
+        if e.kind == 'call':
+            line = f'{prefix * e.depth} --> {e.call}'
+        else:
+            line = f'{prefix * e.depth} <-- {e.call} {"==" if e.kind == "return" else "!!"} {e.result}'
+            if durations:
+                line += f'  [{e.duration / 1000:.1f} us]'
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def trace(prefix='', size=10000, sample=1):
     '''Trace calls made to function decorated.
 
     @trace("____")
@@ -76,6 +770,7 @@ def trace(func):
         ....
 
     >>> fib(3)
+    >>> print(fib.dump())
      --> fib(3)
     ____ --> fib(2)
     ________ --> fib(1)
@@ -87,12 +782,78 @@ def trace(func):
     ____ <-- fib(1) == 1
      <-- fib(3) == 3
 
+    Events (depth, arguments, result, duration) are kept in a ring
+    buffer wrapper.events of the last size events and printed on
+    demand by wrapper.dump(). With sample=N only every N-th outermost
+    call is traced together with all its nested calls, the others
+    cost a context variable lookup. Can be used bare: @trace.
+    With instrumentation off the function is returned unchanged,
+    without .events and .dump.
     '''
-
-    def wrapper(*args):
-        return func(*args)
-
-    return wrapper
+    if not INSTRUMENTATION:
+        return disable(prefix)
+    if callable(prefix):
+        return trace()(prefix)
+
+    def decorate(func):
+        events = deque(maxlen=size)
+        state = contextvars.ContextVar('trace', default=None)  # (depth, sampled) of the call in progress
+        roots = itertools.count()
+        name = func.__name__
+        clock = time.perf_counter_ns
+
+        def enter():
+            current = state.get()
+            if current is None:
+                depth, sampled = 0, next(roots) % sample == 0
+            else:
+                depth, sampled = current[0] + 1, current[1]
+            return state.set((depth, sampled)), depth, sampled
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args):
+                token, depth, sampled = enter()
+                try:
+                    if not sampled:
+                        return await func(*args)
+                    call = f'{name}({", ".join(map(repr, args))})'
+                    events.append(TraceEvent('call', depth, call, None, 0))
+                    start = clock()
+                    try:
+                        r = await func(*args)
+                    except BaseException as e:
+                        events.append(TraceEvent('raise', depth, call, repr(e), clock() - start))
+                        raise
+                    events.append(TraceEvent('return', depth, call, repr(r), clock() - start))
+                    return r
+                finally:
+                    state.reset(token)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args):
+                token, depth, sampled = enter()
+                try:
+                    if not sampled:
+                        return func(*args)
+                    call = f'{name}({", ".join(map(repr, args))})'
+                    events.append(TraceEvent('call', depth, call, None, 0))
+                    start = clock()
+                    try:
+                        r = func(*args)
+                    except BaseException as e:
+                        events.append(TraceEvent('raise', depth, call, repr(e), clock() - start))
+                        raise
+                    events.append(TraceEvent('return', depth, call, repr(r), clock() - start))
+                    return r
+                finally:
+                    state.reset(token)
+
+        wrapper.events = events
+        wrapper.dump = functools.partial(format_trace, events, prefix)
+        return wrapper
+
+    return decorate
 
 
 @memo
@@ -109,28 +870,30 @@ def bar(a, b):
     return a * b
 
 
-# @countcalls
-# @trace("####")
-# @memo
-# def fib(n):
-#     """Some doc"""
-#     return 1 if n <= 1 else fib(n-1) + fib(n-2)
+@countcalls
+@trace("####")
+@memo
+def fib(n):
+    """Some doc"""
+    return 1 if n <= 1 else fib(n-1) + fib(n-2)
 
 
 def main():
     print(foo(4, 3))
     print(foo(4, 3, 2))
     print(foo(4, 3))
-    print("foo was called", foo.calls, "times")
+    print("foo was called", getattr(foo, 'calls', 'n/a'), "times")
 
     print(bar(4, 3))
     print(bar(4, 3, 2))
     print(bar(4, 3, 2, 1))
-    print("bar was called", bar.calls, "times")
+    print("bar was called", getattr(bar, 'calls', 'n/a'), "times")
     print()
-    # print(fib.__doc__)
-    # fib(3)
-    # print(fib.calls, 'calls made')
+    print(fib.__doc__)
+    fib(3)
+    if INSTRUMENTATION:  # disabled countcalls and trace return fib unchanged
+        print(fib.dump())
+    print(getattr(fib, 'calls', 'n/a'), 'calls made')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,601 @@
+import asyncio
+import concurrent.futures
+import inspect
+import json
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from homeworks.lesson01.deco import benchmark, deco
+from homeworks.lesson01.deco.deco import (LRUCache, ProfileRegistry, SharedMemoryCache, SqliteCache, countcalls, disable,
+                                          memo, n_ary, profile, trace)
+
+
+class FakeTimer(object):
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+
+def fill_cache(path, start, count):
+    """Запись в кэш из отдельного процесса"""
+    cache = SqliteCache(path, namespace='shared')
+    for i in range(start, start + count):
+        cache.set((i,), str(i))
+    cache.close()
+    return count
+
+
+shared_cache = None
+
+
+def init_worker(cache):
+    global shared_cache
+    shared_cache = cache
+
+
+def shared_square(x):
+    """Вычисление в процессе пула через общий кэш: (результат, был ли он в кэше)"""
+    cached = shared_cache.get((x,))
+    if isinstance(cached, int):
+        return cached, True
+    shared_cache.set((x,), x * x)
+    return x * x, False
+
+
+@n_ary(associative=True, workers=2, min_parallel=100)
+def concat(a, b):
+    return a + b
+
+
+@countcalls
+@n_ary(associative=True, workers=2, min_parallel=10)
+def counted_concat(a, b):
+    return a + b
+
+
+def add(a, b):
+    return a + b
+
+
+parallel_add = n_ary(add, associative=True, workers=2, min_parallel=10)
+
+
+def run_with_timeout(func, *args, timeout=5):
+    '''Call in a daemon thread: a hung call fails the test instead of blocking the run'''
+    future = concurrent.futures.Future()
+
+    def call():
+        try:
+            future.set_result(func(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=call, daemon=True).start()
+    return future.result(timeout)
+
+
+class TestMemo(unittest.TestCase):
+    """"""
+
+    def test_memo(self):
+        calls = []
+
+        @memo
+        def square(x):
+            calls.append(x)
+            return x * x
+
+        self.assertEqual([square(2), square(3), square(2)], [4, 9, 4])
+        self.assertListEqual(calls, [2, 3])
+        self.assertEqual(square.__name__, 'square')
+        self.assertEqual(square.cache_info(), (1, 2, 0, 2, None))
+        square.cache_clear()
+        self.assertEqual(square.cache_info().size, 0)
+
+    def test_falsy_results(self):
+        calls = []
+
+        @memo
+        def nothing(x):
+            calls.append(x)
+            return None if x else 0
+
+        for _ in range(3):
+            self.assertIsNone(nothing(1))
+            self.assertEqual(nothing(0), 0)
+        self.assertListEqual(calls, [1, 0])
+
+    def test_lru(self):
+        calls = []
+
+        @memo(maxsize=2)
+        def ident(x):
+            calls.append(x)
+            return x
+
+        for x in (1, 2, 1, 3, 1, 2):  # 3 вытесняет 2, затем 2 вытесняет 3
+            ident(x)
+        self.assertListEqual(calls, [1, 2, 3, 2])
+        info = ident.cache_info()
+        self.assertEqual((info.hits, info.misses, info.evictions, info.size, info.maxsize), (2, 4, 2, 2, 2))
+
+    def test_single_flight(self):
+        calls = []
+        barrier = threading.Barrier(8)
+
+        @memo(thread_safe=True)
+        def slow(x):
+            calls.append(x)
+            time.sleep(.05)  # остальные потоки успевают дождаться результата
+            if x < 0:
+                raise ValueError(x)
+            return x * 2
+
+        def call(x, results):
+            barrier.wait()
+            try:
+                results.append(slow(x))
+            except ValueError as e:
+                results.append(e)
+
+        for x in (21, -1):
+            results = []
+            threads = [threading.Thread(target=call, args=(x, results)) for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(calls.count(x), 1)
+            self.assertEqual(len(results), 8)
+            if x > 0:
+                self.assertListEqual(results, [42] * 8)
+            else:
+                self.assertTrue(all(isinstance(r, ValueError) for r in results))
+
+        # исключение не кэшируется
+        with self.assertRaises(ValueError):
+            slow(-1)
+        self.assertEqual(calls.count(-1), 2)
+        self.assertEqual(slow(21), 42)
+        self.assertEqual(calls.count(21), 1)
+
+    def test_single_flight_cache_error(self):
+        class BrokenCache(LRUCache):
+            def set(self, key, value):
+                raise pickle.PicklingError(key)
+
+        @memo(thread_safe=True, cache=BrokenCache())
+        def ident(x):
+            return x
+
+        # ошибка записи в кэш не оставляет вызов "в полете": повторный вызов не зависает
+        for _ in range(2):
+            with self.assertRaises(pickle.PicklingError):
+                run_with_timeout(ident, 1)
+
+    def test_ttl(self):
+        timer = FakeTimer()
+        cache = LRUCache(ttl=10, timer=timer)
+        cache.set('a', 1)
+        timer.now = 9.9
+        self.assertEqual(cache.get('a'), 1)
+        timer.now = 10
+        self.assertIsNot(cache.get('a'), 1)
+        self.assertEqual(cache.info(), (1, 1, 1, 0, None))
+
+
+class TestSqliteCache(unittest.TestCase):
+    """"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'memo.sqlite')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_persistent(self):
+        calls = []
+
+        def compute(x):
+            calls.append(x)
+            return None if x == 0 else {'x': x}
+
+        for _ in range(2):  # второй проход - "перезапуск" с новым объектом кэша
+            cache = SqliteCache(self.path, namespace='compute')
+            wrapped = memo(compute, cache=cache)
+            self.assertEqual(wrapped(1), {'x': 1})
+            self.assertIsNone(wrapped(0))
+            self.assertEqual(wrapped(1), {'x': 1})
+            cache.close()
+        self.assertListEqual(calls, [1, 0])
+        self.assertEqual(cache.info(), (3, 0, 0, 2, None))  # статистика второго прохода
+
+        # другое пространство имен в том же файле
+        other = SqliteCache(self.path, namespace='other')
+        self.assertEqual(other.info().size, 0)
+        other.clear()
+        self.assertEqual(SqliteCache(self.path, namespace='compute').info().size, 2)
+
+    def test_functions_namespaces(self):
+        # отдельные объекты кэша в одном файле без namespace: результаты функций не смешиваются
+        @memo(cache=SqliteCache(self.path))
+        def square(x):
+            return x * x
+
+        @memo(cache=SqliteCache(self.path))
+        def cube(x):
+            return x * x * x
+
+        self.assertEqual(square(3), 9)
+        self.assertEqual(cube(3), 27)
+        self.assertEqual(square(3), 9)
+        self.assertEqual(square.cache_info().hits, 1)
+        self.assertEqual(cube.cache_info().size, 1)
+
+    def test_eviction(self):
+        cache = SqliteCache(self.path, maxsize=2, used_granularity=0)
+        for key in ('a', 'b'):
+            cache.set(key, key)
+        time.sleep(.01)
+        self.assertEqual(cache.get('a'), 'a')  # 'a' использован позже 'b'
+        cache.set('c', 'c')
+        self.assertNotEqual(cache.get('b'), 'b')
+        self.assertEqual(cache.get('a'), 'a')
+        self.assertEqual(cache.info().evictions, 1)
+
+        cache = SqliteCache(self.path, ttl=0, namespace='ttl')
+        cache.set('a', 1)
+        self.assertIsNot(cache.get('a'), 1)
+        self.assertEqual(cache.info(), (0, 1, 1, 0, None))
+
+    def test_used_granularity(self):
+        cache = SqliteCache(self.path, maxsize=2, namespace='used', used_granularity=60)
+        cache.set('a', 1)
+        conn = sqlite3.connect(self.path)
+        used = conn.execute("SELECT used FROM memo WHERE ns = 'used'").fetchone()[0]
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(conn.execute("SELECT used FROM memo WHERE ns = 'used'").fetchone()[0], used)  # недавнее время не перезаписывается
+        conn.execute("UPDATE memo SET used = used - 60 WHERE ns = 'used'")
+        conn.commit()
+        self.assertEqual(cache.get('a'), 1)
+        self.assertGreaterEqual(conn.execute("SELECT used FROM memo WHERE ns = 'used'").fetchone()[0], used)
+        conn.close()
+
+    def test_processes(self):
+        with concurrent.futures.ProcessPoolExecutor(4) as pool:
+            futures = [pool.submit(fill_cache, self.path, i * 100, 100) for i in range(4)]
+            self.assertEqual(sum(f.result() for f in futures), 400)
+        cache = SqliteCache(self.path, namespace='shared')
+        self.assertEqual(cache.info().size, 400)
+        self.assertEqual(cache.get((123,)), '123')
+
+
+class TestSharedMemoryCache(unittest.TestCase):
+    """"""
+
+    def test_cache(self):
+        cache = SharedMemoryCache(slots=64, value_size=32)
+        try:
+            calls = []
+
+            @memo(cache=cache)
+            def compute(x):
+                calls.append(x)
+                return None if x == 0 else 'x' * x
+
+            for _ in range(2):
+                self.assertEqual([compute(x) for x in (0, 1, 5, 100)], [None, 'x', 'xxxxx', 'x' * 100])
+            # значение длиннее value_size не кэшируется
+            self.assertListEqual(calls, [0, 1, 5, 100, 100])
+            self.assertEqual(cache.oversized, 2)
+            info = cache.info()
+            self.assertEqual((info.hits, info.size, info.maxsize), (3, 3, 64))
+            cache.clear()
+            self.assertEqual(cache.info().size, 0)
+        finally:
+            cache.close()
+
+    def test_eviction(self):
+        cache = SharedMemoryCache(slots=4, max_probe=2)
+        try:
+            for i in range(100):
+                cache.set(i, i)
+            self.assertEqual(cache.info().size, 4)
+            self.assertGreater(cache.evictions, 0)
+            self.assertEqual(cache.get(99), 99)  # последняя запись всегда в таблице
+        finally:
+            cache.close()
+
+    def test_processes(self):
+        for method in ('fork', 'spawn'):
+            context = multiprocessing.get_context(method)
+            cache = SharedMemoryCache(slots=1024, context=context)
+            try:
+                with concurrent.futures.ProcessPoolExecutor(2, mp_context=context, initializer=init_worker,
+                                                            initargs=(cache,)) as pool:
+                    first = list(pool.map(shared_square, range(50)))
+                    second = list(pool.map(shared_square, range(50)))
+                self.assertListEqual([r for r, _ in first], [x * x for x in range(50)])
+                self.assertListEqual(second, [(x * x, True) for x in range(50)])  # записи других процессов видны
+                self.assertEqual(cache.get((7,)), 49)
+                self.assertEqual(cache.info().size, 50)
+            finally:
+                cache.close()
+
+
+class TestProfile(unittest.TestCase):
+    """"""
+
+    def test_countcalls(self):
+        @memo
+        @countcalls
+        def add(a, b):
+            return a + b
+
+        for args in ((1, 2), (1, 2), (2, 3)):
+            add(*args)
+        self.assertEqual(add.calls, 2)  # счетчик обновляется и во внешней обертке
+        self.assertEqual(f'{add.calls}', '2')
+        self.assertEqual(f'{add.calls:>3}', '  2')
+        self.assertEqual(add.calls + 1, 3)
+        self.assertEqual(1 + add.calls, 3)
+        self.assertEqual(add.calls - 1, 1)
+        self.assertEqual(5 - add.calls, 3)
+        self.assertTrue(add.calls > 1)
+        self.assertTrue(add.calls <= 2)
+        self.assertTrue(3 >= add.calls)
+        self.assertEqual(sorted([3, add.calls, 1]), [1, 2, 3])
+        self.assertEqual(json.dumps(add.calls.value), '2')
+        self.assertEqual(add.__name__, 'add')
+
+    def test_profile(self):
+        registry = ProfileRegistry()
+
+        @profile(registry=registry)
+        def child():
+            time.sleep(.002)
+
+        @profile(registry=registry)
+        def parent(n):
+            if n:
+                parent(n - 1)
+            child()
+
+        parent(2)
+        self.assertEqual((parent.stats.calls, child.stats.calls), (3, 3))
+        self.assertGreaterEqual(child.stats.total, 6000000)
+        # рекурсия учитывается один раз, время child не входит в собственное время parent
+        self.assertGreaterEqual(parent.stats.total, child.stats.total)
+        self.assertLess(parent.stats.total, child.stats.total * 2)
+        self.assertLess(parent.stats.self_time, child.stats.total / 2)
+        self.assertEqual(sum(child.stats.histogram), 3)
+        p50 = child.stats.percentile(50)
+        self.assertTrue(2000000 <= p50 < 8000000 * 2, p50)
+        self.assertLessEqual(p50, child.stats.percentile(99))
+
+        data = json.loads(registry.dump_json())
+        self.assertEqual(set(data), {parent.stats.name, child.stats.name})
+        self.assertEqual(data[child.stats.name]['calls'], 3)
+        text = registry.dump_text().splitlines()
+        self.assertEqual(len(text), 3)
+        self.assertIn('parent', text[1])  # по убыванию общего времени
+        registry.reset()
+        self.assertEqual(registry.to_dict()[child.stats.name]['calls'], 0)
+        child()
+        self.assertEqual(registry.to_dict()[child.stats.name]['calls'], 1)
+        self.assertEqual(sum(child.stats.histogram), 1)
+
+    def test_profile_threads(self):
+        registry = ProfileRegistry()
+        started = threading.Barrier(2)
+
+        @profile(registry=registry)
+        def work():
+            started.wait()  # вызовы в двух потоках перекрываются
+            time.sleep(.01)
+
+        threads = [threading.Thread(target=work) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(work.stats.calls, 2)
+        self.assertGreaterEqual(work.stats.total, 20000000)
+        self.assertGreaterEqual(work.stats.total, work.stats.self_time)
+
+    def test_profile_async(self):
+        registry = ProfileRegistry()
+
+        @profile(registry=registry)
+        async def sleep():
+            await asyncio.sleep(.001)
+
+        async def run():
+            await asyncio.gather(sleep(), sleep())
+
+        asyncio.run(run())
+        self.assertTrue(inspect.iscoroutinefunction(sleep))
+        self.assertEqual(registry.to_dict()[sleep.stats.name]['calls'], 2)
+
+
+class TestTrace(unittest.TestCase):
+    """"""
+
+    def test_tree(self):
+        @trace("____")
+        def fib(n):
+            return 1 if n <= 1 else fib(n - 1) + fib(n - 2)
+
+        self.assertEqual(fib(3), 3)
+        expected = [
+            ' --> fib(3)',
+            '____ --> fib(2)',
+            '________ --> fib(1)',
+            '________ <-- fib(1) == 1',
+            '________ --> fib(0)',
+            '________ <-- fib(0) == 1',
+            '____ <-- fib(2) == 2',
+            '____ --> fib(1)',
+            '____ <-- fib(1) == 1',
+            ' <-- fib(3) == 3',
+        ]
+        self.assertListEqual(fib.dump().splitlines(), expected)
+        self.assertTrue(all(e.duration >= 0 for e in fib.events))
+        self.assertIn(' us]', fib.dump(durations=True))
+
+    def test_sampling(self):
+        @trace(size=50, sample=3)
+        def countdown(n):
+            return countdown(n - 1) if n else 0
+
+        for n in range(6):
+            countdown(n)
+        # трассированы вызовы countdown(0) и countdown(3) со всеми вложенными
+        roots = [e.call for e in countdown.events if e.kind == 'call' and e.depth == 0]
+        self.assertListEqual(roots, ['countdown(0)', 'countdown(3)'])
+        self.assertEqual(len(countdown.events), 2 + 8)
+
+        for _ in range(100):
+            countdown(10)
+        self.assertEqual(len(countdown.events), 50)  # кольцевой буфер
+
+    def test_raise(self):
+        @trace
+        def fail(x):
+            raise ValueError(x)
+
+        with self.assertRaises(ValueError):
+            fail(1)
+        self.assertEqual(fail.dump().splitlines()[-1], " <-- fail(1) !! ValueError(1)")
+
+
+class TestNAry(unittest.TestCase):
+    """"""
+
+    def test_n_ary(self):
+        nest = n_ary(lambda x, y: f'({x}{y})')
+        self.assertEqual(nest('a'), 'a')
+        self.assertEqual(nest('a', 'b'), '(ab)')
+        self.assertEqual(nest('a', 'b', 'c', 'd'), '(a(b(cd)))')
+        with self.assertRaises(TypeError):
+            nest()
+
+        add = n_ary(lambda x, y: x + y)
+        self.assertEqual(add(*range(100000)), sum(range(100000)))  # без рекурсии
+
+    def test_associative(self):
+        tree = n_ary(lambda x, y: f'({x}{y})', associative=True)
+        self.assertEqual(tree('a', 'b', 'c', 'd', 'e'), '(((ab)(cd))e)')
+        words = [str(i) for i in range(1001)]
+        self.assertEqual(n_ary(associative=True)(lambda x, y: x + y)(*words), ''.join(words))
+
+    def test_parallel(self):
+        words = [str(i) for i in range(1000)]
+        self.assertEqual(concat(*words), ''.join(words))
+        self.assertEqual(concat(*words[:10]), ''.join(words[:10]))  # меньше min_parallel - без пула
+        self.assertEqual(concat(*words), ''.join(words))  # пул создается один раз
+        self.assertEqual(len(deco._pools), 1)
+
+        # n_ary под другим декоратором
+        self.assertEqual(counted_concat(*words[:20]), ''.join(words[:20]))
+        self.assertEqual(counted_concat.calls, 1)
+
+        def local(a, b):
+            return a + b
+
+        with self.assertRaises(ValueError):
+            n_ary(local, associative=True, workers=2)
+        with self.assertRaises(ValueError):
+            n_ary(lambda a, b: a + b, associative=True, workers=2)
+
+        # обычный вызов без синтаксиса декоратора: по имени в модуле - сама бинарная функция
+        self.assertEqual(parallel_add(*range(100)), sum(range(100)))
+
+
+class TestDisable(unittest.TestCase):
+    """"""
+
+    def tearDown(self):
+        deco.set_instrumentation(True)
+
+    def test_disable(self):
+        def square(x):
+            return x * x
+
+        self.assertIs(disable(square), square)
+        self.assertIs(disable(maxsize=10)(square), square)
+        self.assertIs(disable("####")(square), square)
+
+        deco.set_instrumentation(False)
+        for decorated in (countcalls(square), profile(square), profile(registry=ProfileRegistry())(square),
+                          trace(square), trace("####", sample=10)(square)):
+            self.assertIs(decorated, square)
+        self.assertIsNot(memo(square), square)  # memo - не инструментирование
+
+        deco.set_instrumentation(True)
+        self.assertIsNot(countcalls(square), square)
+
+    def test_main_disabled(self):
+        # демо модуля работает и без инструментирования
+        result = subprocess.run([sys.executable, '-m', 'homeworks.lesson01.deco.deco'], capture_output=True,
+                                text=True, env={**os.environ, deco.DISABLE_ENV: '1'})
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('foo was called n/a times', result.stdout)
+
+    def test_benchmark(self):
+        results = benchmark.run(number=1000)
+        self.assertEqual([name for name, _, _ in results], [name for name, _ in benchmark.DECORATORS])
+        self.assertTrue(deco.INSTRUMENTATION)
+
+
+class TestAsync(unittest.TestCase):
+    """"""
+
+    def test_memo(self):
+        calls = []
+
+        @memo
+        async def fetch(x):
+            calls.append(x)
+            await asyncio.sleep(.01)
+            if x < 0:
+                raise ValueError(x)
+            return x * 2
+
+        async def run():
+            results = await asyncio.gather(*[fetch(21) for _ in range(5)])
+            errors = await asyncio.gather(*[fetch(-1) for _ in range(3)], return_exceptions=True)
+            return results, errors, await fetch(21), await asyncio.gather(fetch(-1), return_exceptions=True)
+
+        self.assertTrue(inspect.iscoroutinefunction(fetch))
+        results, errors, cached, retry = asyncio.run(run())
+        self.assertListEqual(results, [42] * 5)
+        self.assertEqual(cached, 42)
+        self.assertTrue(all(isinstance(e, ValueError) for e in errors + retry))
+        # одновременные вызовы выполняются один раз, исключение не кэшируется
+        self.assertListEqual(calls, [21, -1, -1])
+        self.assertEqual(fetch.cache_info().size, 1)
+
+    def test_wrappers(self):
+        async def double(x):
+            return x * 2
+
+        for decorator in (countcalls, trace):
+            wrapped = decorator(double)
+            self.assertTrue(inspect.iscoroutinefunction(wrapped))
+            self.assertEqual(asyncio.run(wrapped(2)), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Замер скорости чтения лога для каждого кодека сжатия.
+
+Запуск:
+    python -m homeworks.lesson01.log_analizer.loganalizer.benchmark [--log FILE] [--size MB]
+"""
+import argparse
+import bz2
+import gzip
+import lzma
+import os
+import tempfile
+import time
+
+from homeworks.lesson01.log_analizer.loganalizer.loganalizer import CODECS, open_log, zstandard
+
+SAMPLE_LOG = os.path.join(os.path.dirname(__file__), '..', 'tests', 'log', 'nginx-access-ui.log-20150630')
+DEFAULT_SIZE = 50  # размер несжатого лога для замера, Мб
+
+COMPRESSORS = {
+    '': lambda data: data,
+    '.gz': gzip.compress,
+    '.bz2': bz2.compress,
+    '.xz': lzma.compress,
+    '.zst': (lambda data: zstandard.ZstdCompressor().compress(data)) if zstandard else None,
+}
+
+
+def make_sample(log_path: str, size: int) -> bytes:
+    """Несжатый лог размером не меньше size Мб из повторяющихся строк log_path"""
+    with open(log_path, 'rb') as fp:
+        chunk = fp.read()
+    return chunk * (size * (1 << 20) // len(chunk) + 1)
+
+
+def bench_codec(data: bytes, ext: str, tmpdir: str) -> tuple[float, float, int]:
+    """Возвращает (коэффициент сжатия, скорость чтения Мб/с, количество строк)"""
+    compressed = COMPRESSORS[ext](data)
+    log_path = os.path.join(tmpdir, f'access.log{ext}')
+    with open(log_path, 'wb') as fp:
+        fp.write(compressed)
+
+    lines = 0
+    start = time.perf_counter()
+    with open_log(log_path) as fp:
+        for _ in fp:
+            lines += 1
+    duration = time.perf_counter() - start
+    os.unlink(log_path)
+
+    return len(data) / len(compressed), len(data) / (1 << 20) / duration, lines
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='benchmark.py')
+    parser.add_argument('--log', default=SAMPLE_LOG, help='Несжатый лог-образец')
+    parser.add_argument('--size', type=int, default=DEFAULT_SIZE, help='Размер несжатых данных, Мб')
+    args = parser.parse_args()
+
+    data = make_sample(args.log, args.size)
+    print(f'{"codec":<8}{"ratio":>8}{"MB/s":>10}{"lines":>12}')
+    with tempfile.TemporaryDirectory(prefix='bench_') as tmpdir:
+        for ext in COMPRESSORS:
+            name = CODECS[ext].name if ext else 'plain'
+            if COMPRESSORS[ext] is None:
+                print(f'{name:<8}{"пропущен, нет пакета zstandard":>30}')
+                continue
+            ratio, speed, lines = bench_codec(data, ext, tmpdir)
+            print(f'{name:<8}{ratio:>8.1f}{speed:>10.1f}{lines:>12}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,30 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import argparse
+import bz2
+import contextlib
 import gzip
+import io
 import json
 import logging
+import lzma
 import os
+import random
 import re
+import resource
 import sys
+import time
 import typing
 from collections import namedtuple
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import PurePath
 from string import Template
 
+try:
+    import zstandard
+except ImportError:  # zstd опционален
+    zstandard = None
+
 # log_format ui_short '$remote_addr  $remote_user $http_x_real_ip [$time_local] "$request" '
 #                     '$status $body_bytes_sent "$http_referer" '
 #                     '"$http_user_agent" "$http_x_forwarded_for" "$http_X_REQUEST_ID" "$http_X_RB_USER" '
@@ -32,8 +44,49 @@ LOG_DATE_FORMAT = '%Y.%m.%d%H:%M:%S'
 LOG_FILE_DATE_FORMAT = '%Y%m%d'  # формат даты в наименовании файла обрабатываемого лога
 REPORT_FILE_DATE_FORMAT = '%Y.%m.%d'  # формат даты для имени файла отчета
 REPORT_FILE_NAME_TEMPLATE = 'report-%s.html'
-NGINX_LOG_FILE_RE = re.compile(r'nginx-access-ui\.log-([\d]{8})(\.gz|\b)')
 ENCODING = 'UTF-8'
+ERRORS_SAMPLE_SIZE = 5  # количество сохраняемых примеров строк с ошибками разбора
+ERRORS_SAMPLE_LINE_LIMIT = 300  # максимальная длина сохраняемой строки-примера
+ERRORS_MIN_LINES = 10000  # период (в строках) досрочной проверки порога ошибок
+MIN_LINE_LENGTH = 26  # длина самой короткой строки, подходящей под LOG_REGEX
+READ_BUFFER_SIZE = 1 << 20  # размер блока чтения лога
+STDIN_NAME = '-'  # имя лога для чтения из stdin
+STAT_DIR = './stat'  # каталог хранения агрегатов статистики по url для поиска регрессий
+STAT_FILE_NAME_TEMPLATE = 'stat-%s.json.gz'
+STAT_FIELDS = ('count', 'time_sum', 'time_med')  # сохраняемые поля статистики
+STAT_KEEP_DAYS = 31  # срок хранения агрегатов
+REGRESSION_METRICS = ('time_med', 'time_sum')  # метрики, по которым ищутся регрессии
+REGRESSION_THRESHOLD = 0.2  # допустимый рост метрики относительно базы
+REGRESSION_MIN_COUNT = 10  # минимум запросов url для учета в регрессиях
+REGRESSION_BASELINE_DAYS = 7  # окно скользящей базы
+URL_CACHE_SIZE = 100000  # размер кэша нормализованных url
+# предустановленные правила нормализации url: имя -> (regex, замена)
+URL_RULE_PRESETS = {
+    'query': (r'\?.*', ''),  # отбросить query string
+    'uuid': (r'(?<=/)[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}(?=/|\?|$)', ':id'),
+    'numeric': (r'(?<=/)\d+(?=/|\?|$)', ':id'),  # числовые сегменты пути
+}
+METRICS_DIR = './metrics'  # каталог файлов метрик запуска (textfile collector node_exporter и json)
+METRICS_NAME = 'loganalizer'  # имя файлов метрик и префикс метрик prometheus
+
+
+def _open_zstd(fp):
+    """Поток распаковки zstd"""
+    if zstandard is None:
+        raise SystemError('Для чтения логов в формате zstd необходим пакет zstandard')
+    return zstandard.ZstdDecompressor().stream_reader(fp, read_size=READ_BUFFER_SIZE)
+
+
+# реестр кодеков сжатия логов: расширение -> кодек, формат определяется по сигнатуре (magic bytes)
+Codec = namedtuple('Codec', 'name ext magic open')
+CODECS = {
+    '.gz': Codec('gzip', '.gz', b'\x1f\x8b', lambda fp: gzip.GzipFile(fileobj=fp, mode='rb')),
+    '.bz2': Codec('bzip2', '.bz2', b'BZh', lambda fp: bz2.BZ2File(fp, mode='rb')),
+    '.xz': Codec('xz', '.xz', b'\xfd7zXZ\x00', lambda fp: lzma.LZMAFile(fp, mode='rb')),
+    '.zst': Codec('zstd', '.zst', b'\x28\xb5\x2f\xfd', _open_zstd),
+}
+MAGIC_SIZE = max(len(c.magic) for c in CODECS.values())
+NGINX_LOG_FILE_RE = re.compile(r'nginx-access-ui\.log-([\d]{8})(%s|\b)' % '|'.join(re.escape(e) for e in CODECS))
 
 
 def get_config(config=None) -> dict:
@@ -44,6 +97,10 @@ def get_config(config=None) -> dict:
     # аргументы командной строки в dict
     parser = argparse.ArgumentParser(prog='log_analizer.py')
     parser.add_argument("--config", dest='config', default=None, help="Файл конфигурации json")
+    parser.add_argument("log", nargs='?', default=None,
+                        help=f"Файл или FIFO для потокового чтения лога, '{STDIN_NAME}' - stdin")
+    parser.add_argument("--date", dest='date', default=None,
+                        help=f"Дата отчета при потоковом чтении лога ({LOG_FILE_DATE_FORMAT.replace('%', '')})")
     args = parser.parse_args()
 
     if args.config:
@@ -53,14 +110,20 @@ def get_config(config=None) -> dict:
                 config.update(json.load(fp))
         except (FileNotFoundError, FileExistsError) as e:
             raise SystemError(e)
+    # потоковое чтение лога
+    if args.log:
+        config['LOG_STREAM'] = args.log
+    if args.date:
+        config['LOG_DATE'] = args.date
     #
-    if 'ERRORS_THRESHOLD' in config:
-        et = config.get('ERRORS_THRESHOLD')
-        if isinstance(et, str) and et.endswith('%'):
-            et = float(et[:-1]) / 100
-        else:
-            et = float(et)
-        config['ERRORS_THRESHOLD'] = et
+    for key in ('ERRORS_THRESHOLD', 'REGRESSION_THRESHOLD'):
+        if key in config:
+            et = config.get(key)
+            if isinstance(et, str) and et.endswith('%'):
+                et = float(et[:-1]) / 100
+            else:
+                et = float(et)
+            config[key] = et
 
     return config
 
@@ -85,6 +148,23 @@ def get_last_log_data(config: dict) -> namedtuple:
     return log_data
 
 
+def get_stream_log_data(config: dict) -> namedtuple:
+    """Данные лога при потоковом чтении из stdin или FIFO, дата отчета берется из config"""
+    log_name = config['LOG_STREAM']
+    if log_name != STDIN_NAME:
+        log_name = os.path.abspath(log_name)
+
+    log_date = config.get('LOG_DATE')
+    if not log_date:
+        raise SystemError('Для потокового чтения лога необходимо указать дату отчета --date')
+    try:
+        fdate = datetime.strptime(log_date, LOG_FILE_DATE_FORMAT)
+    except ValueError as e:
+        raise SystemError(f'Неверная дата отчета {log_date}: {e}')
+
+    return namedtuple('log_data', 'log_name log_date log_ext')(log_name, fdate, '')
+
+
 def get_report_name(log_data: namedtuple):
     return REPORT_FILE_NAME_TEMPLATE % log_data.log_date.strftime(REPORT_FILE_DATE_FORMAT)
 
@@ -108,48 +188,356 @@ def get_median(data: list) -> typing.Union[int, float]:
         return round(sum(data[half - 1: half + 1]) / 2, 3)
 
 
-def parse_log(config: dict, logger: logging.Logger, log_data: namedtuple) -> tuple[dict, int, int]:
-    """Парсит лог nginx из файла, указанного в config"""
-    log_name = PurePath(config.get('LOG_DIR')) / log_data.log_name
+class ParseErrors:
+    """Сборщик ошибок разбора лога.
+
+    Вместо записи в лог каждой ошибочной строки считает ошибки по категориям
+    и хранит ограниченную выборку строк-примеров (reservoir sampling).
+    По окончании разбора выдается одна сводка.
+    """
+
+    def __init__(self, threshold: typing.Optional[float] = None, sample_size: int = ERRORS_SAMPLE_SIZE,
+                 min_lines: int = ERRORS_MIN_LINES, seed: typing.Optional[int] = None, abort_stream: bool = False):
+        """
+        - threshold: допустимая доля ошибок (0..1), None - без ограничения
+        - sample_size: размер выборки строк-примеров
+        - min_lines: период досрочной проверки порога, в строках
+        - seed: инициализация генератора случайных чисел выборки
+        - abort_stream: досрочно прерывать разбор лога неизвестного объема (stdin, FIFO, сжатый лог)
+          по текущей доле ошибок, хотя остаток лога мог бы ее снизить
+        """
+        self.threshold = threshold
+        self.sample_size = sample_size
+        self.min_lines = min_lines
+        self.abort_stream = abort_stream
+        self.count = 0  # общее количество ошибок
+        self.categories = {}  # количество ошибок по категориям
+        self.samples = []  # выборка строк-примеров (категория, строка)
+        self._random = random.Random(seed)
+
+    def add(self, category: str, line: typing.Union[str, bytes]):
+        """Фиксация ошибки разбора строки"""
+        self.count += 1
+        self.categories[category] = self.categories.get(category, 0) + 1
+        if len(self.samples) < self.sample_size:
+            self.samples.append((category, self._cut(line)))
+        else:
+            # алгоритм R: каждая строка попадает в выборку с вероятностью sample_size / count
+            i = self._random.randrange(self.count)
+            if i < self.sample_size:
+                self.samples[i] = (category, self._cut(line))
+
+    @staticmethod
+    def _cut(line):
+        """Укороченное представление строки для выборки"""
+        if isinstance(line, bytes):
+            line = line.decode(ENCODING, errors='replace')
+        return line[:ERRORS_SAMPLE_LINE_LIMIT].rstrip()
+
+    def ratio(self, lines_count: int) -> float:
+        """Доля ошибок от общего количества строк"""
+        return self.count / lines_count if lines_count else 0.
+
+    def exceeded(self, lines_count: int) -> bool:
+        """Превышен ли порог допустимого количества ошибок"""
+        return bool(self.threshold) and self.ratio(lines_count) > self.threshold
+
+    def should_abort(self, lines_count: int, remaining_bytes: typing.Optional[int] = None) -> bool:
+        """Досрочная проверка порога во время разбора.
+
+        - remaining_bytes: объем непрочитанной части лога, None - неизвестен
+
+        При известном остатке разбор прерывается, только если порог будет превышен
+        при любом его содержимом: даже если весь остаток - корректные строки
+        минимальной длины. Иначе - только при abort_stream, по текущей доле ошибок
+        после min_lines строк.
+        """
+        if not self.threshold:
+            return False
+        if remaining_bytes is None:
+            return self.abort_stream and lines_count >= self.min_lines and self.exceeded(lines_count)
+        return self.count > self.threshold * (lines_count + remaining_bytes / MIN_LINE_LENGTH)
+
+    def summary(self) -> str:
+        """Сводка ошибок разбора одной строкой"""
+        categories = ', '.join(f'{k}: {v}' for k, v in sorted(self.categories.items()))
+        samples = ''.join(f'\n  [{c}] {line}' for c, line in self.samples)
+        return f'Ошибок при разборе: {self.count} ({categories}), примеры:{samples}'
+
+
+def detect_codec(head: bytes) -> typing.Optional[Codec]:
+    """Определение кодека по сигнатуре начала потока, None - несжатый лог"""
+    for codec in CODECS.values():
+        if head.startswith(codec.magic):
+            return codec
+    return None
+
+
+def get_log_size(log_name: typing.Union[str, PurePath]) -> typing.Optional[int]:
+    """Объем несжатого лога в байтах, None - если объем заранее неизвестен (stdin, FIFO, сжатый лог)"""
+    if str(log_name) == STDIN_NAME or not os.path.isfile(log_name):
+        return None
+    with open(log_name, 'rb') as fp:
+        if detect_codec(fp.read(MAGIC_SIZE)) is not None:
+            return None
+    return os.path.getsize(log_name)
+
+
+class _HeadReader(io.RawIOBase):
+    """Поток без позиционирования (pipe) с уже прочитанным началом: сначала отдается начало, затем остаток"""
+
+    def __init__(self, head: bytes, stream: io.BufferedReader):
+        self._head = head
+        self._stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._head:
+            n = min(len(buffer), len(self._head))
+            buffer[:n] = self._head[:n]
+            self._head = self._head[n:]
+            return n
+        data = self._stream.read1(len(buffer))  # read1 не ждет заполнения всего буфера
+        buffer[:len(data)] = data
+        return len(data)
+
+
+@contextlib.contextmanager
+def open_log(log_name: typing.Union[str, PurePath]):
+    """Открывает лог на чтение блоками READ_BUFFER_SIZE.
+
+    Сжатие определяется по сигнатуре в начале потока, поэтому расширение файла
+    не важно и поддерживается чтение из stdin и FIFO.
+    """
+    if str(log_name) == STDIN_NAME:
+        raw = open(sys.stdin.fileno(), 'rb', buffering=READ_BUFFER_SIZE, closefd=False)
+    else:
+        raw = open(log_name, 'rb', buffering=READ_BUFFER_SIZE)
+
+    try:
+        # read, в отличие от peek, ждет MAGIC_SIZE байт или конца потока: в pipe сигнатура может прийти по частям
+        head = raw.read(MAGIC_SIZE)
+        codec = detect_codec(head)
+        if raw.seekable():
+            raw.seek(-len(head), io.SEEK_CUR)
+            stream = raw
+        else:
+            stream = io.BufferedReader(_HeadReader(head, raw), buffer_size=READ_BUFFER_SIZE)
+        if codec is None:
+            fp = stream
+        else:
+            # распакованный поток читается крупными блоками, строки нарезаются из буфера
+            fp = io.BufferedReader(codec.open(stream), buffer_size=READ_BUFFER_SIZE)
+
+        with fp:
+            yield fp
+    finally:
+        raw.close()
+
+
+class UrlNormalizer:
+    """Нормализация url перед агрегацией: схлопывание идентификаторов в пути, отбрасывание query string.
+
+    Правила применяются по порядку. Результат кэшируется, т.к. одни и те же url
+    повторяются в логе многократно.
+    """
+
+    def __init__(self, rules: list, cache_size: int = URL_CACHE_SIZE):
+        """
+        - rules: список правил, правило - имя из URL_RULE_PRESETS или пара [regex, замена]
+        - cache_size: максимальный размер кэша, при переполнении кэш очищается
+        """
+        self.rules = []
+        for rule in rules:
+            if isinstance(rule, str):
+                if rule not in URL_RULE_PRESETS:
+                    raise SystemError(f'Неизвестное правило нормализации url: {rule}')
+                rule = URL_RULE_PRESETS[rule]
+            pattern, repl = rule
+            self.rules.append((re.compile(pattern, re.IGNORECASE).sub, repl))
+        self.cache_size = cache_size
+        self._cache = {}
+
+    def __call__(self, url: str) -> str:
+        try:
+            return self._cache[url]
+        except KeyError:
+            pass
+        normalized = url
+        for sub, repl in self.rules:
+            normalized = sub(repl, normalized)
+        if len(self._cache) >= self.cache_size:
+            self._cache.clear()
+        self._cache[url] = normalized
+        return normalized
+
+
+def get_url_normalizer(config: dict) -> typing.Optional[UrlNormalizer]:
+    """Нормализатор url по правилам URL_RULES из config, None - если правила не заданы"""
+    rules = config.get('URL_RULES')
+    if not rules:
+        return None
+    return UrlNormalizer(rules, cache_size=config.get('URL_CACHE_SIZE', URL_CACHE_SIZE))
+
+
+class RunMetrics:
+    """Метрики запуска анализатора для мониторинга.
+
+    Сохраняются в формате textfile collector node_exporter и в json.
+    """
+    # описания метрик prometheus
+    descriptions = {
+        'lines': 'Processed log lines',
+        'parse_errors': 'Log lines failed to parse',
+        'parse_errors_by_category': 'Log lines failed to parse by category',
+        'bytes_read': 'Uncompressed log bytes read',
+        'report_rows': 'Rows in the generated report',
+        'peak_memory_bytes': 'Peak resident memory of the run',
+        'duration_seconds': 'Total run duration',
+        'phase_duration_seconds': 'Run duration by phase',
+        'last_run_success': 'Whether the last run succeeded',
+        'last_run_timestamp_seconds': 'Unix time of the last run',
+    }
+    # метки метрик-словарей; у каждой метрики одна серия без меток или только серии с метками,
+    # иначе sum() по метрике считает значения дважды
+    labels = {
+        'parse_errors_by_category': 'category',
+        'phase_duration_seconds': 'phase',
+    }
+
+    def __init__(self):
+        self.values = {}  # метрики-значения
+        self.errors = {}  # ошибки разбора по категориям
+        self.phases = {}  # длительность этапов, сек
+        self.success = False
+        self._started = time.perf_counter()
+        self._timestamp = time.time()
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Замер длительности этапа"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.) + time.perf_counter() - start
+
+    def to_dict(self) -> dict:
+        """Метрики в виде словаря"""
+        # ru_maxrss в Linux в килобайтах
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return {
+            **self.values,
+            'parse_errors_by_category': dict(self.errors),
+            'peak_memory_bytes': peak_memory,
+            'duration_seconds': round(time.perf_counter() - self._started, 6),
+            'phase_duration_seconds': {k: round(v, 6) for k, v in self.phases.items()},
+            'last_run_success': int(self.success),
+            'last_run_timestamp_seconds': int(self._timestamp),
+        }
+
+    def to_prometheus(self) -> str:
+        """Метрики в текстовом формате prometheus"""
+        data = self.to_dict()
+        lines = []
+        for name, value in data.items():
+            metric = f'{METRICS_NAME}_{name}'
+            lines.append(f'# HELP {metric} {self.descriptions.get(name, name)}')
+            lines.append(f'# TYPE {metric} gauge')
+            if name in self.labels:
+                lines.extend(f'{metric}{{{self.labels[name]}="{k}"}} {v}' for k, v in value.items())
+            else:
+                lines.append(f'{metric} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, metrics_dir: str) -> tuple[str, str]:
+        """Запись файлов метрик. Файлы заменяются атомарно, чтобы node_exporter не прочитал
+        недописанный файл"""
+        os.makedirs(metrics_dir, exist_ok=True)
+        paths = []
+        for ext, content in (('prom', self.to_prometheus()), ('json', json.dumps(self.to_dict(), indent=2))):
+            path = os.path.join(metrics_dir, f'{METRICS_NAME}.{ext}')
+            with open(f'{path}.tmp', 'w', encoding=ENCODING) as fp:
+                fp.write(content)
+            os.replace(f'{path}.tmp', path)
+            paths.append(path)
+        return tuple(paths)
+
+
+def parse_log(config: dict, logger: logging.Logger, log_data: namedtuple,
+              metrics: typing.Optional[RunMetrics] = None) -> tuple[dict, int, int]:
+    """Парсит лог nginx из файла, указанного в config, при наличии metrics фиксирует метрики разбора"""
+    if log_data.log_name == STDIN_NAME:
+        log_name = STDIN_NAME
+    else:
+        log_name = PurePath(config.get('LOG_DIR')) / log_data.log_name
     requests_count = 0  # общее кол-во запросов
     requests_time = 0  # суммарное время всех запросов
-    parsing_error_count = 0  # счетчик ошибок парсинга
+    bytes_read = 0  # объем прочитанных данных
     parsed_data = {}
-    reader = open if not log_data.log_ext else gzip.open
+    error_threshold = config.get('ERRORS_THRESHOLD', None)
+    errors = ParseErrors(error_threshold,
+                         sample_size=config.get('ERRORS_SAMPLE_SIZE', ERRORS_SAMPLE_SIZE),
+                         min_lines=config.get('ERRORS_MIN_LINES', ERRORS_MIN_LINES),
+                         abort_stream=config.get('ERRORS_ABORT_STREAM', False))
+    min_lines = errors.min_lines if error_threshold else 0
+    log_size = get_log_size(log_name) if error_threshold else None
+    normalize = get_url_normalizer(config)
 
     # парсинг лога по regex
     logger.info(f'Разбор файла {log_name}')
-    with reader(log_name, 'rb') as fp:
+    with open_log(log_name) as fp:
         for row in fp:
-            line = row.decode(encoding=ENCODING)
-            matched = LOG_REGEX.match(line)
-            if matched:
-                row_data = matched.groupdict()
-                data = parsed_data.setdefault(row_data['url'], [])
-                url_request_time = float(row_data['time'])
-                requests_time += url_request_time
-                data.append(url_request_time)
-                logger.debug(row_data)
-            else:
-                # считаем ошибка парсинга
-                logger.error(f'Ошибка разбора: {line}')
-                parsing_error_count += 1
-
             requests_count += 1
+            bytes_read += len(row)
+            try:
+                line = row.decode(encoding=ENCODING)
+            except UnicodeDecodeError:
+                errors.add('decode', row)
+            else:
+                matched = LOG_REGEX.match(line)
+                if matched is None:
+                    errors.add('format', line)
+                else:
+                    try:
+                        url_request_time = float(matched.group('time'))
+                    except ValueError:
+                        errors.add('time', line)
+                    else:
+                        url = matched.group('url')
+                        if normalize is not None:
+                            url = normalize(url)
+                        data = parsed_data.setdefault(url, [])
+                        requests_time += url_request_time
+                        data.append(url_request_time)
+
+            # досрочная проверка порога раз в min_lines строк, включая не декодированные
+            if (min_lines and requests_count % min_lines == 0
+                    and errors.should_abort(requests_count, None if log_size is None else log_size - bytes_read)):
+                if metrics is not None:
+                    metrics.values.update(lines=requests_count, parse_errors=errors.count, bytes_read=bytes_read)
+                    metrics.errors.update(errors.categories)
+                logger.error(errors.summary())
+                raise SystemError(f'Превышен порог допустимого количества ошибок при разборе в '
+                                  f'{error_threshold * 100}%, разбор прерван на строке {requests_count}!')
+
+    if metrics is not None:
+        metrics.values.update(lines=requests_count, parse_errors=errors.count, bytes_read=bytes_read)
+        metrics.errors.update(errors.categories)
 
     # проверка количества записей
-    if requests_count == 0 and parsing_error_count == 0:
+    if requests_count == 0:
         raise SystemError(
-            f'Ошибка парсинга или пустой лог-файл {log_name}, найдено строк: {requests_count}, ошибок: {parsing_error_count}')
+            f'Ошибка парсинга или пустой лог-файл {log_name}, найдено строк: {requests_count}, ошибок: {errors.count}')
 
     logger.info(f'Обработано строк: {requests_count}')
 
     # проверка разбора на ошибки
-    if parsing_error_count > 0:
-        logger.info(f'Ошибок при разборе: {parsing_error_count}')
-    err_perc = parsing_error_count / requests_count  # % ошибок
-    error_threshold = config.get('ERRORS_THRESHOLD', None)
-    if error_threshold and err_perc > error_threshold:
+    if errors.count > 0:
+        logger.error(errors.summary())
+    if errors.exceeded(requests_count):
         raise SystemError(f'Превышен порог допустимого количества ошибок при разборе в {error_threshold * 100}%!')
 
     return parsed_data, requests_count, requests_time
@@ -176,6 +564,90 @@ def calculate_stat(config, logger, parsed_map, requests_count, requests_time) ->
     return parsed_map
 
 
+def get_stat_path(config: dict, log_date: datetime) -> str:
+    """Путь к файлу агрегатов статистики на дату"""
+    stat_dir = config.get('STAT_DIR', STAT_DIR)
+    return os.path.join(stat_dir, STAT_FILE_NAME_TEMPLATE % log_date.strftime(LOG_FILE_DATE_FORMAT))
+
+
+def save_stat(config: dict, logger: logging.Logger, stat: dict, log_data: namedtuple):
+    """Сохраняет агрегаты статистики по url в компактном виде: {url: [count, time_sum, time_med]}"""
+    stat_path = get_stat_path(config, log_data.log_date)
+    os.makedirs(os.path.dirname(stat_path), exist_ok=True)
+    data = {url: [row[f] for f in STAT_FIELDS] for url, row in stat.items()}
+    with gzip.open(stat_path, 'wt', encoding=ENCODING) as fp:
+        json.dump(data, fp, separators=(',', ':'))
+    logger.info(f'Сохранены агрегаты статистики {stat_path}')
+
+    # удаление устаревших агрегатов
+    keep_from = log_data.log_date - timedelta(days=config.get('STAT_KEEP_DAYS', STAT_KEEP_DAYS))
+    stat_dir = os.path.dirname(stat_path)
+    for fn in os.listdir(stat_dir):
+        try:
+            fdate = datetime.strptime(fn, STAT_FILE_NAME_TEMPLATE % LOG_FILE_DATE_FORMAT)
+        except ValueError:
+            continue
+        if fdate < keep_from:
+            os.unlink(os.path.join(stat_dir, fn))
+
+
+def load_stat(config: dict, log_date: datetime) -> typing.Optional[dict]:
+    """Загружает агрегаты статистики на дату, None - если агрегатов нет"""
+    stat_path = get_stat_path(config, log_date)
+    if not os.path.exists(stat_path):
+        return None
+    with gzip.open(stat_path, 'rt', encoding=ENCODING) as fp:
+        data = json.load(fp)
+    return {url: dict(zip(STAT_FIELDS, row)) for url, row in data.items()}
+
+
+def find_regressions(config: dict, logger: logging.Logger, stat: dict, log_data: namedtuple) -> list:
+    """Поиск url, у которых time_med или time_sum выросли более чем на REGRESSION_THRESHOLD
+    относительно предыдущего дня или среднего за REGRESSION_BASELINE_DAYS дней"""
+    threshold = config.get('REGRESSION_THRESHOLD', REGRESSION_THRESHOLD)
+    min_count = config.get('REGRESSION_MIN_COUNT', REGRESSION_MIN_COUNT)
+    days = config.get('REGRESSION_BASELINE_DAYS', REGRESSION_BASELINE_DAYS)
+
+    history = []  # агрегаты за предыдущие дни, от ближайшего
+    for n in range(1, days + 1):
+        day_stat = load_stat(config, log_data.log_date - timedelta(days=n))
+        if day_stat is not None:
+            history.append((n, day_stat))
+    if not history:
+        logger.info('Нет сохраненных агрегатов за предыдущие дни, регрессии не рассчитываются')
+        return []
+
+    regressions = []
+    for url, row in stat.items():
+        if row['count'] < min_count:
+            continue
+        for metric in REGRESSION_METRICS:
+            current = row[metric]
+            bases = []
+            n, day_stat = history[0]
+            if n == 1 and url in day_stat:
+                bases.append(('day', day_stat[url][metric]))
+            values = [day_stat[url][metric] for _, day_stat in history if url in day_stat]
+            # среднее по одному вчерашнему дню совпадает с базой 'day', регрессия не дублируется
+            if len(values) > 1 or (values and not bases):
+                bases.append((f'{days}d', sum(values) / len(values)))
+
+            for base, prev in bases:
+                if prev > 0 and current > prev * (1 + threshold):
+                    regressions.append({
+                        'url': url,
+                        'metric': metric,
+                        'base': base,
+                        'prev': round(prev, 3),
+                        'current': current,
+                        'growth_perc': round((current - prev) / prev * 100, 3),
+                    })
+
+    regressions.sort(key=lambda r: r['growth_perc'], reverse=True)
+    logger.info(f'Найдено регрессий: {len(regressions)}')
+    return regressions[:config.get('REPORT_SIZE', len(regressions))]
+
+
 def gen_report_data(config, logger, parsed_map) -> dict:
     """Подготовка данных по url'ам для генерации отчета"""
     # выдача отсортированных данных по time_sum в количестве REPORT_SIZE
@@ -193,7 +665,8 @@ def gen_report_data(config, logger, parsed_map) -> dict:
     logger.info(f'Сгенерировано строк данных в отчет: {given}')
 
 
-def generate_report(config: dict, logger: logging.Logger, parsed_log: dict, log_data: namedtuple):
+def generate_report(config: dict, logger: logging.Logger, parsed_log: dict, log_data: namedtuple,
+                    regressions: typing.Optional[list] = None):
     """"""
     report_name = get_report_name(log_data)
 
@@ -202,16 +675,18 @@ def generate_report(config: dict, logger: logging.Logger, parsed_log: dict, log_
 
     # запуск процесса формирования данных для отчета и сериализуем в json
     table = json.dumps([m for m in parsed_log], indent=2)
-    templ.safe_substitute(table_json=table)
+    regressions_table = json.dumps(regressions or [], indent=2)
 
     report_path = os.path.join(config['REPORT_DIR'], report_name)
     with open(report_path, 'w', encoding=ENCODING) as fp:
-        fp.write(templ.safe_substitute(table_json=table))
+        fp.write(templ.safe_substitute(table_json=table, regressions_json=regressions_table))
 
     logger.info(f'Сформирован отчет {report_path}')
 
 
 def main():
+    config = None
+    metrics = RunMetrics()
     try:
         config = get_config()
         # set logger
@@ -220,15 +695,25 @@ def main():
         logging.basicConfig(format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT, filename=logfile, level=loglevel)
         logger = logging.getLogger(__name__)
 
-        log_data = get_last_log_data(config)  # поиск последнего лога
+        if config.get('LOG_STREAM'):
+            log_data = get_stream_log_data(config)  # потоковое чтение из stdin или FIFO
+        else:
+            log_data = get_last_log_data(config)  # поиск последнего лога
 
         if report_exists(config, log_data):  # выходим, если отчет на определенную дату уже существует
             raise SystemExit(f"Отчет уже создан: {os.path.join(config['REPORT_DIR'], get_report_name(log_data))}")
 
-        parsed_log_data = parse_log(config, logger, log_data)  # разбор данных лога и подготовка данных для отчета
-        stat = calculate_stat(config, logger, *parsed_log_data)  # подсчет статистики
-        report_data = gen_report_data(config, logger, stat)  # генератор данных для отчета
-        generate_report(config, logger, report_data, log_data)  # формирование отчета
+        with metrics.phase('parse'):  # разбор данных лога и подготовка данных для отчета
+            parsed_log_data = parse_log(config, logger, log_data, metrics)
+        with metrics.phase('stat'):
+            stat = calculate_stat(config, logger, *parsed_log_data)  # подсчет статистики
+            regressions = find_regressions(config, logger, stat, log_data)  # сравнение с предыдущими днями
+            save_stat(config, logger, stat, log_data)  # сохранение агрегатов для следующих запусков
+        with metrics.phase('report'):
+            report_data = list(gen_report_data(config, logger, stat))  # данные для отчета
+            generate_report(config, logger, report_data, log_data, regressions)  # формирование отчета
+        metrics.values['report_rows'] = len(report_data)
+        metrics.success = True
 
     except SystemError as e:
         logger.error(e)
@@ -236,11 +721,19 @@ def main():
 
     except SystemExit as e:
         logger.info(e)
+        metrics.success = True
 
     except Exception as e:
         logging.exception(e)
         sys.exit(2)
 
+    finally:
+        if config is not None:
+            try:
+                metrics.write(config.get('METRICS_DIR', METRICS_DIR))
+            except OSError as e:
+                logging.error(f'Ошибка записи метрик: {e}')
+
 
 if __name__ == "__main__":
     main()
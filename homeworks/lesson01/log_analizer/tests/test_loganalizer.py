@@ -1,19 +1,25 @@
+import bz2
 import datetime
 import gzip
 import json
 import logging
+import lzma
 import os.path
 import re
 import sys
 import tempfile
+import threading
 import time
 import typing
 import unittest
 from collections import namedtuple
 
-from homeworks.lesson01.log_analizer.loganalizer.loganalizer import (DEFAULT_CONFIG, ENCODING, calculate_stat,
-                                                                     gen_report_data, generate_report, get_config,
-                                                                     get_last_log_data, get_median, get_report_name,
+from homeworks.lesson01.log_analizer.loganalizer.loganalizer import (DEFAULT_CONFIG, ENCODING, LOG_REGEX, ParseErrors, RunMetrics,
+                                                                     UrlNormalizer,
+                                                                     calculate_stat, find_regressions, gen_report_data,
+                                                                     generate_report, get_config, get_last_log_data,
+                                                                     get_median, load_stat, save_stat,
+                                                                     get_report_name, get_stream_log_data, open_log,
                                                                      parse_log, report_exists)
 
 logging.basicConfig(level=logging.CRITICAL)
@@ -75,6 +81,190 @@ class TestLogAnalizer(unittest.TestCase):
                 self.assertEqual(requests_count, expected[1])
                 self.assertEqual(round(requests_time, 3), expected[2])
 
+    def test_parse_errors(self):
+        errors = ParseErrors(.1, sample_size=3, min_lines=10, seed=1)
+        for n in range(100):
+            errors.add('format' if n % 2 else 'time', f'line {n}\n')
+        errors.add('decode', b'\xff\xfe')
+
+        self.assertEqual(errors.count, 101)
+        self.assertDictEqual(errors.categories, {'format': 50, 'time': 50, 'decode': 1})
+        self.assertEqual(len(errors.samples), 3)
+        self.assertTrue(all(not line.endswith('\n') for _, line in errors.samples))
+        self.assertIn('format: 50', errors.summary())
+
+        # объем остатка неизвестен: без abort_stream разбор не прерывается
+        self.assertFalse(errors.should_abort(200))
+        stream_errors = ParseErrors(.1, min_lines=10, abort_stream=True)
+        stream_errors.count = 101
+        self.assertFalse(stream_errors.should_abort(5))  # мало строк для досрочной проверки
+        self.assertTrue(stream_errors.should_abort(200))
+        self.assertFalse(stream_errors.should_abort(2000))
+        # объем остатка известен: прерывание, только если порог превышен при любом остатке
+        self.assertTrue(errors.should_abort(200, remaining_bytes=0))
+        self.assertFalse(errors.should_abort(200, remaining_bytes=1 << 20))
+        self.assertFalse(ParseErrors(None).exceeded(1))
+        self.assertFalse(ParseErrors(None).should_abort(200, remaining_bytes=0))
+
+        with open(f'{self.dirname}/log/nginx-access-ui.log-20150630', 'rb') as fp:
+            valid = [line for line in fp if LOG_REGEX.match(line.decode(ENCODING))]
+        with tempfile.TemporaryDirectory(prefix='test_') as tmpdir:
+            log_path = os.path.join(tmpdir, 'nginx-access-ui.log-20150630')
+            config = get_config({'LOG_DIR': tmpdir, 'ERRORS_THRESHOLD': 0.05, 'ERRORS_MIN_LINES': 10})
+
+            # 6% ошибок в начале лога и чистый хвост: итоговая доля 1.5%, разбор не прерывается
+            with open(log_path, 'wb') as fp:
+                for n in range(100):
+                    fp.write(b'bad line\n' if n % 100 < 6 else valid[n % len(valid)])
+                for n in range(300):
+                    fp.write(valid[n % len(valid)])
+            _, requests_count, _ = parse_log(config, logger, get_last_log_data(config))
+            self.assertEqual(requests_count, 400)
+
+            # превышение порога неизбежно задолго до конца лога: 20 ошибок больше 5% от 20 строк
+            # и строк, умещающихся в остаток
+            with open(log_path, 'wb') as fp:
+                fp.write(b'bad line\n' * 200)
+                fp.writelines(valid[:20])
+            with self.assertRaisesRegex(SystemError, 'прерван на строке 20!'):
+                parse_log(config, logger, get_last_log_data(config))
+
+            # то же для строк, не прошедших декодирование
+            with open(log_path, 'wb') as fp:
+                fp.write(b'\xff\xfe bad line\n' * 200)
+                fp.writelines(valid[:20])
+            with self.assertRaisesRegex(SystemError, 'прерван на строке 20!'):
+                parse_log(config, logger, get_last_log_data(config))
+
+    def test_parse_log_stream(self):
+        with open(f'{self.dirname}/log_gz/nginx-access-ui.log-20150630.gz', 'rb') as fp:
+            payload = fp.read()
+
+        with tempfile.TemporaryDirectory(prefix='test_') as tmpdir:
+            # сжатие определяется по сигнатуре, а не по расширению
+            plain_gz = os.path.join(tmpdir, 'access.log')
+            with open(plain_gz, 'wb') as fp:
+                fp.write(payload)
+            with open_log(plain_gz) as fp:
+                self.assertEqual(len(fp.readlines()), 28)
+
+            # чтение из FIFO
+            fifo = os.path.join(tmpdir, 'access.fifo')
+            os.mkfifo(fifo)
+
+            def writer():
+                with open(fifo, 'wb') as fp:
+                    fp.write(payload)
+
+            thread = threading.Thread(target=writer)
+            thread.start()
+            config = get_config({'LOG_DIR': self.dirname, 'LOG_STREAM': fifo, 'LOG_DATE': '20170630'})
+            log_data = get_stream_log_data(config)
+            self.assertEqual(log_data.log_date, datetime.datetime(2017, 6, 30))
+            parsed_data, requests_count, requests_time = parse_log(config, logger, log_data)
+            thread.join()
+            self.assertEqual(requests_count, 28)
+            self.assertEqual(round(requests_time, 3), 19.486)
+            self.assertEqual(len(parsed_data), 8)
+
+            # сигнатура приходит в FIFO по частям
+            def slow_writer():
+                with open(fifo, 'wb') as fp:
+                    fp.write(payload[:1])
+                    fp.flush()
+                    time.sleep(.1)
+                    fp.write(payload[1:])
+
+            thread = threading.Thread(target=slow_writer)
+            thread.start()
+            with open_log(fifo) as fp:
+                lines = fp.readlines()
+            thread.join()
+            self.assertEqual(len(lines), 28)
+            self.assertTrue(lines[0].startswith(b'1.200.76.128'))
+
+        # bz2, xz: определение по сигнатуре, имя файла без расширения
+        with open(f'{self.dirname}/log/nginx-access-ui.log-20150630', 'rb') as fp:
+            plain = fp.read()
+        with tempfile.TemporaryDirectory(prefix='test_') as tmpdir:
+            for compress in (bz2.compress, lzma.compress):
+                log_path = os.path.join(tmpdir, 'access.log')
+                with open(log_path, 'wb') as fp:
+                    fp.write(compress(plain))
+                with open_log(log_path) as fp:
+                    self.assertEqual(fp.read(), plain)
+
+        # без даты отчета потоковое чтение невозможно
+        for conf in ({'LOG_STREAM': '-'}, {'LOG_STREAM': '-', 'LOG_DATE': '2017-06-30'}):
+            with self.assertRaises(SystemError):
+                get_stream_log_data(conf)
+
+        sys.argv.extend('- --date 20170630'.split())
+        config = get_config({})
+        self.assertDictEqual(config, {'LOG_STREAM': '-', 'LOG_DATE': '20170630'})
+        self.assertEqual(get_stream_log_data(config).log_name, '-')
+
+    def test_run_metrics(self):
+        metrics = RunMetrics()
+        config = get_config({'LOG_DIR': f'{self.dirname}/log'})
+        log_data = get_last_log_data(config)
+        with metrics.phase('parse'):
+            parse_log(config, logger, log_data, metrics)
+        metrics.success = True
+
+        data = metrics.to_dict()
+        self.assertEqual(data['lines'], 28)
+        self.assertEqual(data['parse_errors'], 2)
+        self.assertDictEqual(data['parse_errors_by_category'], {'format': 2})
+        self.assertEqual(data['bytes_read'], os.path.getsize(f'{self.dirname}/log/{log_data.log_name}'))
+        self.assertIn('parse', data['phase_duration_seconds'])
+        self.assertGreater(data['peak_memory_bytes'], 0)
+        self.assertEqual(data['last_run_success'], 1)
+
+        prom = metrics.to_prometheus()
+        self.assertIn('loganalizer_lines 28\n', prom)
+        self.assertIn('loganalizer_parse_errors 2\n', prom)
+        self.assertIn('loganalizer_parse_errors_by_category{category="format"} 2\n', prom)
+        self.assertNotIn('loganalizer_parse_errors{', prom)
+        self.assertRegex(prom, r'loganalizer_phase_duration_seconds\{phase="parse"\} [\d.e-]+\n')
+
+        with tempfile.TemporaryDirectory(prefix='test_') as tmpdir:
+            prom_path, json_path = metrics.write(tmpdir)
+            self.assertListEqual(sorted(os.listdir(tmpdir)), ['loganalizer.json', 'loganalizer.prom'])
+            with open(json_path, encoding=ENCODING) as fp:
+                self.assertEqual(json.load(fp)['lines'], 28)
+
+    def test_url_normalizer(self):
+        normalize = UrlNormalizer(['query', 'uuid', 'numeric', [r'^/export/.+\.csv(\.gz)?$', '/export/:file']],
+                                  cache_size=2)
+        fixtures = (
+            ('/api/v2/banner/25019354', '/api/v2/banner/:id'),
+            ('/api/v2/banner/25019354/', '/api/v2/banner/:id/'),
+            ('/api/1/banners/?campaign=7789704', '/api/:id/banners/'),
+            ('/api/v2/group/1a2b3c4d-0000-4e5f-8a9b-0123456789AB/stat', '/api/v2/group/:id/stat'),
+            ('/api/v2/banner/v2', '/api/v2/banner/v2'),
+            ('/api/v2/slot/4705x/groups', '/api/v2/slot/4705x/groups'),
+            ('/export/2017/report.csv.gz', '/export/:file'),
+            ('/', '/'),
+        )
+        for url, expected in fixtures:
+            self.assertEqual(normalize(url), expected)
+            self.assertEqual(normalize(url), expected)  # из кэша
+        self.assertLessEqual(len(normalize._cache), 2)
+
+        with self.assertRaises(SystemError):
+            UrlNormalizer(['unknown'])
+
+        config = get_config({'LOG_DIR': f'{self.dirname}/log', 'URL_RULES': ['query', 'numeric']})
+        parsed_data, requests_count, _ = parse_log(config, logger, get_last_log_data(config))
+        self.assertEqual(requests_count, 28)
+        self.assertListEqual(sorted(parsed_data), [
+            '/', '/accounts/login/', '/api/:id/banners/', '/api/v2/banner/:id',
+            '/api/v2/internal/storage/gpmd_plan_report/result.csv.gz', '/api/v2/slot/:id/groups',
+            '/api/v2/target/:id/list',
+        ])
+        self.assertEqual(len(parsed_data['/accounts/login/']), 5)
+
     def test_calculate_stat(self):
         expected = {
             '/api/1/banners/?campaign=7789704': {'count': 5, 'count_perc': 17.857, 'time_sum': 15.0,
@@ -104,6 +294,46 @@ class TestLogAnalizer(unittest.TestCase):
 
         self.assertDictEqual(expected, stat)
 
+    def test_find_regressions(self):
+        with tempfile.TemporaryDirectory(prefix='test_') as tmpdir:
+            config = get_config({'LOG_DIR': f'{self.dirname}/log', 'STAT_DIR': tmpdir, 'REGRESSION_MIN_COUNT': 1,
+                                 'REGRESSION_THRESHOLD': '20%'})
+            log_data = get_last_log_data(config)
+            stat = calculate_stat(config, logger, *parse_log(config, logger, log_data))
+
+            # нет истории - нет регрессий
+            self.assertListEqual(find_regressions(config, logger, stat, log_data), [])
+
+            url = '/api/1/banners/?campaign=7789704'  # time_med 3.0, time_sum 15.0
+            history = (
+                (1, {url: {'count': 5, 'time_sum': 15.0, 'time_med': 2.0}}),  # вчера медиана 2.0
+                (3, {url: {'count': 5, 'time_sum': 5.0, 'time_med': 3.0}}),
+                (10, {url: {'count': 5, 'time_sum': 1.0, 'time_med': 0.1}}),  # вне окна базы
+            )
+            # сохранен только вчерашний день: база за REGRESSION_BASELINE_DAYS совпадает с 'day' и не дублирует ее
+            yesterday = log_data._replace(log_date=log_data.log_date - datetime.timedelta(days=1))
+            save_stat(config, logger, history[0][1], yesterday)
+            self.assertListEqual(find_regressions(config, logger, stat, log_data), [
+                {'url': url, 'metric': 'time_med', 'base': 'day', 'prev': 2.0, 'current': 3.0, 'growth_perc': 50.0},
+            ])
+
+            for days, day_stat in history:
+                day = log_data._replace(log_date=log_data.log_date - datetime.timedelta(days=days))
+                save_stat(config, logger, day_stat, day)
+            self.assertDictEqual(load_stat(config, log_data.log_date - datetime.timedelta(days=1)), history[0][1])
+            self.assertIsNone(load_stat(config, log_data.log_date))
+
+            result = find_regressions(config, logger, stat, log_data)
+            self.assertListEqual(result, [
+                {'url': url, 'metric': 'time_med', 'base': 'day', 'prev': 2.0, 'current': 3.0, 'growth_perc': 50.0},
+                {'url': url, 'metric': 'time_sum', 'base': '7d', 'prev': 10.0, 'current': 15.0, 'growth_perc': 50.0},
+            ])
+
+            # агрегаты старше STAT_KEEP_DAYS удаляются
+            config['STAT_KEEP_DAYS'] = 5
+            save_stat(config, logger, stat, log_data)
+            self.assertEqual(len(os.listdir(tmpdir)), 3)
+
     def test_gen_report_data(self):
         fixtures = (
             ({'LOG_DIR': f'{self.dirname}/log', 'REPORT_SIZE': 30}, 8, False),
@@ -268,7 +498,6 @@ class TestLogAnalizer(unittest.TestCase):
                 ('apache-access-ui.log-20170628.gz', None, None),
                 ('apache-access-ui-log-20170628.gz', None, None),
                 ('nginx-access-ui-log-20170628.gz', None, None),
-                ('nginx-access-ui.log-20170630.bz2', None, None),
                 ('nginx-access-ui.log-20170630.zip', None, None),
                 ('nginx-access-ui.log-20170630.rar', None, None),
                 ('nginx-access-ui.log-20170630.zg', None, None),
@@ -283,6 +512,9 @@ class TestLogAnalizer(unittest.TestCase):
                 ('nginx-access-ui.log-20160802', datetime.datetime(2016, 8, 2), ''),
                 ('nginx-access-ui.log-20170721', datetime.datetime(2017, 7, 21), ''),
                 ('nginx-access-ui.log-20181210.gz', datetime.datetime(2018, 12, 10), '.gz'),
+                ('nginx-access-ui.log-20181211.bz2', datetime.datetime(2018, 12, 11), '.bz2'),
+                ('nginx-access-ui.log-20181212.xz', datetime.datetime(2018, 12, 12), '.xz'),
+                ('nginx-access-ui.log-20181213.zst', datetime.datetime(2018, 12, 13), '.zst'),
             ]
 
             for fn, _, _ in fixtures_error:  # заполнение логами
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Пакетная оценка рук на NumPy.
+
+rank_hands принимает массив (N, 5..7) кодов карт (см. evaluator) и возвращает
+массив сил рук, совместимых с evaluator.eval5/eval7. Оценка выполняется
+векторно, без цикла по рукам:
+- флеш определяется по маскам рангов каждой масти и таблице FLUSH_BY_MASK;
+- без флеша сила зависит только от набора рангов, набор кодируется произведением
+  простых чисел рангов и ищется в отсортированной таблице (searchsorted).
+"""
+import functools
+import itertools
+
+import numpy as np
+
+from homeworks.lesson01.poker.evaluator import (CARD_PRIMES, FLUSHES, POPCOUNT, PRIMES, SUIT_CHARS, STRAIGHTS, TOP5,
+                                                eval7)
+
+CARD_PRIMES_NP = np.array(CARD_PRIMES, dtype=np.int64)
+# маска рангов одной масти -> сила флеша, 0 - флеша нет
+FLUSH_BY_MASK = np.array([FLUSHES[STRAIGHTS[m] or TOP5[m]] if POPCOUNT[m] >= 5 else 0 for m in range(1 << 13)],
+                         dtype=np.int64)
+
+
+@functools.lru_cache(maxsize=None)
+def nonflush_table(n):
+    """Таблица для рук из n карт без флеша: (отсортированные произведения простых чисел рангов, силы)"""
+    products, strengths = [], []
+    for ranks in itertools.combinations_with_replacement(range(13), n):
+        if any(ranks.count(r) > 4 for r in ranks):
+            continue
+        # масти раздаются по кругу: в n <= 7 картах не набирается 5 одной масти
+        cards = [r * 4 + i % len(SUIT_CHARS) for i, r in enumerate(ranks)]
+        product = 1
+        for r in ranks:
+            product *= PRIMES[r]
+        products.append(product)
+        strengths.append(eval7(cards))
+    order = np.argsort(products)
+    return np.array(products, dtype=np.int64)[order], np.array(strengths, dtype=np.int64)[order]
+
+
+def rank_hands(hands):
+    """Силы рук для массива (N, n) кодов карт, n от 5 до 7"""
+    cards = np.asarray(hands, dtype=np.int64)
+    if cards.ndim != 2 or not 5 <= cards.shape[1] <= 7:
+        raise ValueError(f'Ожидается массив (N, 5..7), получен {cards.shape}')
+
+    # без флеша: поиск набора рангов по произведению простых чисел
+    products = CARD_PRIMES_NP[cards].prod(axis=1)
+    keys, values = nonflush_table(cards.shape[1])
+    strengths = values[np.searchsorted(keys, products)]
+
+    # флеш: маска рангов каждой масти
+    bits = np.left_shift(1, cards >> 2)
+    suits = cards & 3
+    for suit in range(4):
+        mask = np.bitwise_or.reduce(np.where(suits == suit, bits, 0), axis=1)
+        flush = FLUSH_BY_MASK[mask]
+        strengths = np.where(flush > 0, flush, strengths)
+
+    return strengths
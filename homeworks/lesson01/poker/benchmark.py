@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Замер скорости оценки рук и сверка быстрых реализаций с эталоном.
+
+Корпус рук фиксирован seed'ом: руки из 5ти и 7ми карт и руки из 7ми карт с
+джокерами. Для каждой пары (эталон из poker.py, быстрая реализация) выводится
+скорость в руках в секунду, ускорение и количество расхождений. Результаты
+сравниваются по кортежу hand_rank, поэтому при равных по силе руках выбор
+конкретных карт не считается расхождением.
+
+Запуск:
+    python -m homeworks.lesson01.poker.benchmark [--hands N] [--wild N] [--seed N]
+
+Код выхода 1, если хотя бы одна быстрая реализация расходится с эталоном.
+"""
+import argparse
+import random
+import sys
+import time
+from collections import namedtuple
+
+from homeworks.lesson01.poker import canonical
+from homeworks.lesson01.poker.evaluator import CARDS, best_hand7, encode_hand, fast_hand_rank, strength_to_rank
+from homeworks.lesson01.poker.incremental import HandState
+from homeworks.lesson01.poker.poker import best_hand, best_wild_hand, hand_rank
+from homeworks.lesson01.poker.wild import JOKER_SUITS, best_wild_hand7
+
+try:
+    from homeworks.lesson01.poker.batch import rank_hands
+except ImportError:  # numpy опционален
+    rank_hands = None
+
+DEFAULT_HANDS = 10000  # рук из 5ти и из 7ми карт
+DEFAULT_WILD = 100  # рук с джокерами, эталон перебирает все замены и медленный
+DEFAULT_SEED = 2022
+
+# - corpus: ключ корпуса
+# - reference, fast: функции от руки (или от всего корпуса при vectorized)
+# - ref_key, fast_key: приведение результата к кортежу hand_rank для сверки
+Case = namedtuple('Case', 'name corpus reference fast ref_key fast_key vectorized')
+
+
+def _same(rank):
+    return rank
+
+
+def _incremental(hand):
+    return HandState.from_hand(hand).strength()
+
+
+def _batch(hands):
+    return rank_hands([encode_hand(h) for h in hands]).tolist()
+
+
+CASES = [
+    Case('hand_rank / fast_hand_rank', 'hand5', hand_rank, fast_hand_rank, _same, strength_to_rank, False),
+    Case('best_hand / best_hand7', 'hand7', best_hand, best_hand7, hand_rank, hand_rank, False),
+    Case('best_hand / HandState', 'hand7', best_hand, _incremental, hand_rank, strength_to_rank, False),
+    Case('best_hand / rank_hands', 'hand7', best_hand, _batch, hand_rank, strength_to_rank, True),
+    Case('best_wild_hand / best_wild_hand7', 'wild', best_wild_hand, best_wild_hand7, hand_rank, hand_rank,
+         False),
+    Case('best_wild_hand / cached_strength', 'wild', best_wild_hand, canonical.cached_strength, hand_rank,
+         strength_to_rank, False),
+]
+
+Result = namedtuple('Result', 'name hands ref_rate fast_rate mismatches')
+
+
+def make_corpus(hands=DEFAULT_HANDS, wild=DEFAULT_WILD, seed=DEFAULT_SEED):
+    """Корпус рук-строк: {'hand5': [...], 'hand7': [...], 'wild': [...]}"""
+    rnd = random.Random(seed)
+    jokers = list(JOKER_SUITS)
+    wild_hands = []
+    for i in range(wild):
+        n_jokers = 1 + i % 2  # поровну рук с одним и с двумя джокерами
+        wild_hands.append(rnd.sample(CARDS, 7 - n_jokers) + jokers[:n_jokers])
+    return {
+        'hand5': [rnd.sample(CARDS, 5) for _ in range(hands)],
+        'hand7': [rnd.sample(CARDS, 7) for _ in range(hands)],
+        'wild': wild_hands,
+    }
+
+
+def _timed(func, hands, vectorized):
+    start = time.perf_counter()
+    results = func(hands) if vectorized else [func(h) for h in hands]
+    return results, time.perf_counter() - start
+
+
+def run(corpus, cases=CASES):
+    """Замер и сверка всех случаев. Эталон для одного корпуса считается один раз"""
+    references = {}
+    results = []
+    canonical.cache_clear()  # кэш от прошлых вызовов завысил бы скорость
+    for case in cases:
+        if case.fast is _batch and rank_hands is None:
+            continue
+        hands = corpus[case.corpus]
+        key = (case.corpus, case.reference)
+        if key not in references:
+            references[key] = _timed(case.reference, hands, False)
+        expected, ref_elapsed = references[key]
+        if case.vectorized:
+            case.fast(hands[:1])  # таблицы строятся при первом вызове, в замер не входят
+        actual, fast_elapsed = _timed(case.fast, hands, case.vectorized)
+
+        mismatches = [h for h, e, a in zip(hands, expected, actual) if case.ref_key(e) != case.fast_key(a)]
+        results.append(Result(case.name, len(hands), len(hands) / ref_elapsed if ref_elapsed else 0.,
+                              len(hands) / fast_elapsed if fast_elapsed else 0., mismatches))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='benchmark.py')
+    parser.add_argument('--hands', type=int, default=DEFAULT_HANDS, help='Рук из 5ти и из 7ми карт')
+    parser.add_argument('--wild', type=int, default=DEFAULT_WILD, help='Рук с джокерами')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.hands, args.wild, args.seed)
+    print(f'{"case":<36}{"hands":>8}{"ref hands/s":>14}{"fast hands/s":>14}{"speedup":>10}{"errors":>8}')
+    failed = False
+    for r in run(corpus):
+        speedup = r.fast_rate / r.ref_rate if r.ref_rate else 0.
+        print(f'{r.name:<36}{r.hands:>8}{r.ref_rate:>14.0f}{r.fast_rate:>14.0f}{speedup:>9.1f}x{len(r.mismatches):>8}')
+        for hand in r.mismatches[:5]:
+            print(f'    расхождение: {" ".join(hand)}')
+        failed = failed or bool(r.mismatches)
+    if rank_hands is None:
+        print('rank_hands пропущен, нет пакета numpy')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Кэш сил рук с точностью до перестановки мастей.
+
+Сила руки не меняется при перестановке мастей, поэтому рука приводится к
+каноническому ключу - упорядоченному набору масок рангов по мастям. Руки с
+одинаковым ключом (например, AS KS QD и AH KH QC) делят одну запись в
+ограниченном LRU-кэше. Джокеры привязаны к цвету, поэтому для рук с
+джокерами переставляются только масти внутри цвета и цвета целиком
+(вместе с джокерами).
+"""
+import functools
+
+from homeworks.lesson01.poker.evaluator import CARD_BITS, CARD_CODES, CARDS, eval7, fast_hand_rank
+from homeworks.lesson01.poker.wild import JOKER_SUITS, best_wild_hand7
+
+CACHE_SIZE = 1 << 16  # максимум записей кэша
+
+
+def canonical_key(hand):
+    """Канонический ключ руки из строк ('AS', '?B', ...)"""
+    masks = [0, 0, 0, 0]
+    jokers = []
+    for c in hand:
+        if c in JOKER_SUITS:
+            jokers.append(c)
+        else:
+            code = CARD_CODES[c]
+            masks[code & 3] |= CARD_BITS[code]
+    if not jokers:
+        return tuple(sorted(masks, reverse=True))
+
+    # масти C, S - черные, H, D - красные
+    black = (tuple(sorted(masks[:2], reverse=True)), '?B' in jokers)
+    red = (tuple(sorted(masks[2:], reverse=True)), '?R' in jokers)
+    return max((black, red), (red, black))
+
+
+def _representative(key):
+    """Рука из строк, соответствующая ключу"""
+    if isinstance(key[0], int):
+        masks, jokers = key, []
+    else:
+        (first, first_joker), (second, second_joker) = key
+        # первая половина ключа - черные масти, вторая - красные
+        masks = first + second
+        jokers = [j for j, used in (('?B', first_joker), ('?R', second_joker)) if used]
+    return [CARDS[r * 4 + suit] for suit, mask in enumerate(masks) for r in range(13) if mask & (1 << r)] + jokers
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _strength(key):
+    hand = _representative(key)
+    if any(c in JOKER_SUITS for c in hand):
+        return fast_hand_rank(best_wild_hand7(hand))
+    return eval7([CARD_CODES[c] for c in hand])
+
+
+def cached_strength(hand):
+    """Сила лучшей пятерки руки из 5..7 карт (с джокерами или без) через кэш"""
+    return _strength(canonical_key(hand))
+
+
+def cache_info():
+    """Статистика кэша: hits, misses, maxsize, currsize"""
+    return _strength.cache_info()
+
+
+def hit_ratio():
+    """Доля попаданий в кэш"""
+    info = _strength.cache_info()
+    total = info.hits + info.misses
+    return info.hits / total if total else 0.
+
+
+def cache_clear():
+    _strength.cache_clear()
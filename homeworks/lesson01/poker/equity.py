@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Оценка эквити игроков методом Монте-Карло.
+
+Недостающие карты борда раздаются случайно, руки игроков оцениваются как
+best_hand (best_wild_hand при наличии джокеров) через быстрый evaluator.
+Симуляция делится на пачки, которые выполняются в пуле процессов; у каждой
+пачки свой генератор случайных чисел, инициализированный от (seed, номер пачки).
+Расчет останавливается, когда доверительный интервал эквити каждого игрока
+становится уже заданной точности.
+
+Для терна и ривера (и флопа) точнее и быстрее полный перебор оставшихся карт
+борда (exact_equity): расклады, отличающиеся только перестановкой
+равноправных мастей, считаются один раз с весом, а силы рук на каждом борде
+кэшируются и переиспользуются между вызовами с разными соперниками.
+
+Запуск:
+    python -m homeworks.lesson01.poker.equity "AS AD" "KS KH" --board "2C 7H 9D"
+"""
+import argparse
+import concurrent.futures
+import itertools
+import math
+import os
+import random
+import time
+from collections import namedtuple
+
+from homeworks.lesson01.poker.canonical import cached_strength
+from homeworks.lesson01.poker.evaluator import CARD_CODES, CARDS, eval7
+from homeworks.lesson01.poker.wild import JOKER_SUITS
+
+DEFAULT_SAMPLES = 1000000  # максимум симуляций
+DEFAULT_PRECISION = 0.005  # полуширина доверительного интервала эквити
+DEFAULT_CHUNK = 10000  # симуляций в одной пачке
+Z_95 = 1.96  # квантиль нормального распределения для 95% интервала
+
+Equity = namedtuple('Equity', 'win tie equity interval samples elapsed rate')
+SUIT_PERMUTATIONS = list(itertools.permutations(range(4)))
+
+
+def hand_strength(hand):
+    """Сила лучшей пятерки руки из строк, с учетом джокеров"""
+    if any(c in JOKER_SUITS for c in hand):
+        return cached_strength(hand)  # подбор замен джокеров дорогой, результат кэшируется
+    return eval7([CARD_CODES[c] for c in hand])
+
+
+def showdown(players, board):
+    """Силы рук игроков на полном борде"""
+    return [hand_strength(hole + board) for hole in players]
+
+
+def _simulate(players, board, samples, seed):
+    """Пачка симуляций. Возвращает по игрокам (победы, ничьи, сумма долей, сумма квадратов долей)"""
+    rnd = random.Random(seed)
+    known = {c for hole in players for c in hole} | set(board)
+    deck = [c for c in CARDS if c not in known]
+    need = 5 - len(board)
+    wild = any(c in JOKER_SUITS for c in known)
+    codes = [[CARD_CODES[c] for c in hole + board] for hole in players] if not wild else None
+    stats = [[0, 0, 0., 0.] for _ in players]
+
+    for _ in range(samples):
+        runout = rnd.sample(deck, need)
+        if wild:
+            strengths = showdown(players, board + runout)
+        else:
+            extra = [CARD_CODES[c] for c in runout]
+            strengths = [eval7(cards + extra) for cards in codes]
+        best = max(strengths)
+        winners = [i for i, s in enumerate(strengths) if s == best]
+        share = 1 / len(winners)
+        for i in winners:
+            st = stats[i]
+            if len(winners) == 1:
+                st[0] += 1
+            else:
+                st[1] += 1
+            st[2] += share
+            st[3] += share * share
+
+    return stats
+
+
+def _interval(total, total_sq, n):
+    """Полуширина 95% доверительного интервала среднего"""
+    mean = total / n
+    variance = max(total_sq / n - mean * mean, 0.)
+    return Z_95 * math.sqrt(variance / n)
+
+
+def equity(players, board=(), samples=DEFAULT_SAMPLES, precision=DEFAULT_PRECISION, workers=None, seed=None,
+           chunk=DEFAULT_CHUNK):
+    """Эквити игроков методом Монте-Карло.
+
+    - players: карманные карты игроков, список списков строк ('AS', 'KD', '?B', ...)
+    - board: открытые карты борда (0..5)
+    - samples: максимум симуляций
+    - precision: остановка, когда полуширина 95% интервала эквити каждого игрока не больше precision
+    - workers: количество процессов, 1 - без пула, None - по числу процессоров
+    - seed: инициализация генераторов случайных чисел пачек
+
+    Возвращает список Equity по игрокам.
+    """
+    players = [list(hole) for hole in players]
+    board = list(board)
+    cards = [c for hole in players for c in hole] + board
+    if len(cards) != len(set(cards)):
+        raise ValueError('Карты игроков и борда повторяются')
+    if len(board) > 5:
+        raise ValueError('На борде не более 5 карт')
+    if seed is None:
+        seed = random.randrange(1 << 32)
+    workers = workers or os.cpu_count() or 1
+
+    totals = [[0, 0, 0., 0.] for _ in players]
+    done = 0
+    n_chunk = 0
+    start = time.perf_counter()
+    pool = concurrent.futures.ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        while done < samples:
+            # раунд: по пачке на процесс
+            sizes = []
+            while len(sizes) < workers and done + sum(sizes) < samples:
+                sizes.append(min(chunk, samples - done - sum(sizes)))
+            args = [(players, board, size, f'{seed}-{n_chunk + i}') for i, size in enumerate(sizes)]
+            n_chunk += len(sizes)
+            if pool is None:
+                results = [_simulate(*a) for a in args]
+            else:
+                results = list(pool.map(_simulate, *zip(*args)))
+
+            for stats in results:
+                for total, st in zip(totals, stats):
+                    for i in range(4):
+                        total[i] += st[i]
+            done += sum(sizes)
+
+            if max(_interval(t[2], t[3], done) for t in totals) <= precision:
+                break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    elapsed = time.perf_counter() - start
+    return [Equity(win=t[0] / done, tie=t[1] / done, equity=t[2] / done, interval=_interval(t[2], t[3], done),
+                   samples=done, elapsed=elapsed, rate=done / elapsed)
+            for t in totals]
+
+
+def suit_symmetries(groups):
+    """Перестановки мастей, переводящие каждую группу карт (коды) в себя"""
+    return [p for p in SUIT_PERMUTATIONS
+            if all({(c & ~3) | p[c & 3] for c in group} == group for group in groups)]
+
+
+def canonical_cards(cards, perms):
+    """Канонический (минимальный по всем перестановкам мастей) вид набора карт"""
+    return min(tuple(sorted((c & ~3) | p[c & 3] for c in cards)) for p in perms)
+
+
+def exact_equity(players, board=(), cache=None, symmetric=True):
+    """Эквити игроков полным перебором оставшихся карт борда.
+
+    - players, board: как в equity
+    - cache: словарь {борд: {карманные карты: сила}}, передается между вызовами,
+      чтобы не пересчитывать руки, общие для разных соперников
+    - symmetric: учитывать равноправие мастей и пропускать эквивалентные расклады
+
+    Перебор флопа - около тысячи раскладов, префлопа - 1.7 млн, для префлопа
+    лучше equity.
+    """
+    players = [tuple(hole) for hole in players]
+    board = list(board)
+    cards = [c for hole in players for c in hole] + board
+    if len(cards) != len(set(cards)):
+        raise ValueError('Карты игроков и борда повторяются')
+    if len(board) > 5:
+        raise ValueError('На борде не более 5 карт')
+    cache = {} if cache is None else cache
+
+    start = time.perf_counter()
+    wild = any(c in JOKER_SUITS for c in cards)
+    board_codes = [CARD_CODES[c] for c in board if c not in JOKER_SUITS]
+    holes = [[CARD_CODES[c] for c in hole] for hole in players] if not wild else None
+    known = {CARD_CODES[c] for c in cards if c not in JOKER_SUITS}
+    deck = [c for c in range(len(CARDS)) if c not in known]
+    # с джокерами масти неравноправны (джокер заменяет масти своего цвета)
+    perms = suit_symmetries([set(h) for h in holes] + [set(board_codes)]) if symmetric and not wild else []
+
+    # расклады с весами: эквивалентные по перестановке мастей объединяются
+    runouts = {}
+    for runout in itertools.combinations(deck, 5 - len(board)):
+        if len(perms) > 1:
+            runout = canonical_cards(runout, perms)
+        runouts[runout] = runouts.get(runout, 0) + 1
+
+    stats = [[0, 0, 0.] for _ in players]
+    for runout, weight in runouts.items():
+        full_board = board_codes + list(runout)
+        if wild:
+            key = tuple(sorted(board)) + tuple(CARDS[c] for c in runout)
+        else:
+            key = tuple(sorted(full_board))
+        evaluated = cache.setdefault(key, {})
+        strengths = []
+        for n, hole in enumerate(players):
+            strength = evaluated.get(hole)
+            if strength is None:
+                if wild:
+                    strength = hand_strength(list(hole) + board + [CARDS[c] for c in runout])
+                else:
+                    strength = eval7(holes[n] + full_board)
+                evaluated[hole] = strength
+            strengths.append(strength)
+
+        best = max(strengths)
+        winners = [i for i, s in enumerate(strengths) if s == best]
+        for i in winners:
+            stats[i][0 if len(winners) == 1 else 1] += weight
+            stats[i][2] += weight / len(winners)
+
+    total = sum(runouts.values())
+    elapsed = time.perf_counter() - start
+    return [Equity(win=st[0] / total, tie=st[1] / total, equity=st[2] / total, interval=0., samples=total,
+                   elapsed=elapsed, rate=total / elapsed if elapsed else 0.)
+            for st in stats]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='equity.py')
+    parser.add_argument('players', nargs='+', help='Карманные карты игрока, например "AS AD"')
+    parser.add_argument('--board', default='', help='Карты борда, например "2C 7H 9D"')
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES)
+    parser.add_argument('--precision', type=float, default=DEFAULT_PRECISION)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--exact', action='store_true', help='Полный перебор оставшихся карт борда')
+    args = parser.parse_args()
+
+    if args.exact:
+        result = exact_equity([p.split() for p in args.players], args.board.split())
+    else:
+        result = equity([p.split() for p in args.players], args.board.split(), samples=args.samples,
+                        precision=args.precision, workers=args.workers, seed=args.seed)
+    for hole, eq in zip(args.players, result):
+        print(f'{hole:<10} win {eq.win:.4f}  tie {eq.tie:.4f}  equity {eq.equity:.4f} ± {eq.interval:.4f}')
+    print(f'samples {result[0].samples}, {result[0].elapsed:.2f} s, {result[0].rate:.0f} samples/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Быстрая оценка покерных рук по таблицам.
+
+Карта кодируется целым числом 0..51: ранг * 4 + масть, где ранг 0..12 (2..A),
+масть 0..3 (C, S, H, D). Сила руки - целое число, упорядоченное так же, как
+кортежи poker.hand_rank: сравнение сил эквивалентно сравнению кортежей.
+
+Таблицы строятся один раз при импорте по эталонной poker.hand_rank:
+- FLUSHES - маска рангов -> сила для флешей (в т.ч. стрит-флешей);
+- UNIQUE5 - маска рангов -> сила для рук из 5ти разных рангов без флеша;
+- PAIRED - произведение простых чисел рангов -> сила для рук с повторами рангов.
+
+Рука из 7ми карт оценивается за один проход по счетчикам рангов и маскам мастей
+без перебора 21 сочетания по 5 карт (eval7, best_hand7).
+"""
+import itertools
+
+from homeworks.lesson01.poker.poker import hand_rank
+
+RANK_CHARS = '23456789TJQKA'
+SUIT_CHARS = 'CSHD'
+PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)  # простое число на каждый ранг
+STRENGTH_DIGITS = 7  # максимальная длина кортежа hand_rank без категории (две пары: 2 + 5)
+
+CARDS = [r + s for r in RANK_CHARS for s in SUIT_CHARS]  # код карты -> строка
+CARD_CODES = {c: i for i, c in enumerate(CARDS)}  # строка -> код карты
+CARD_BITS = [1 << (i >> 2) for i in range(52)]  # код карты -> бит ранга
+CARD_PRIMES = [PRIMES[i >> 2] for i in range(52)]  # код карты -> простое число ранга
+
+
+def encode_card(card):
+    """Код карты по строке вида 'AS'"""
+    return CARD_CODES[card]
+
+
+def encode_hand(hand):
+    """Список кодов карт по списку строк"""
+    return [CARD_CODES[c] for c in hand]
+
+
+def decode_hand(cards):
+    """Список строк карт по кодам"""
+    return [CARDS[c] for c in cards]
+
+
+def rank_to_strength(rank):
+    """Преобразует кортеж hand_rank в целое число с тем же порядком.
+
+    Кортеж разворачивается в последовательность чисел (категория, ранги...),
+    каждое число занимает 4 бита. Для одной категории длина последовательности
+    одинакова, поэтому дополнение нулями справа сохраняет порядок.
+    """
+    category, *rest = rank
+    digits = []
+    for item in rest:
+        if isinstance(item, (list, tuple)):
+            digits.extend(item)
+        else:
+            digits.append(item)
+    digits.extend([0] * (STRENGTH_DIGITS - len(digits)))
+    strength = category
+    for d in digits:
+        strength = (strength << 4) | d
+    return strength
+
+
+def strength_category(strength):
+    """Категория руки (0 - старшая карта .. 8 - стрит-флеш) по силе"""
+    return strength >> (4 * STRENGTH_DIGITS)
+
+
+def _build_tables():
+    flushes = [0] * (1 << 13)
+    unique5 = [0] * (1 << 13)
+    paired = {}
+    ranks_of = {}  # сила -> кортеж hand_rank
+
+    for ranks in itertools.combinations_with_replacement(range(13), 5):
+        if any(ranks.count(r) > 4 for r in ranks):
+            continue
+        # масти раздаются по кругу, поэтому в руке нет флеша и повторов карт
+        hand = [RANK_CHARS[r] + SUIT_CHARS[i % 4] for i, r in enumerate(ranks)]
+        rank = hand_rank(hand)
+        strength = rank_to_strength(rank)
+        ranks_of[strength] = rank
+        if len(set(ranks)) == 5:
+            mask = sum(1 << r for r in ranks)
+            unique5[mask] = strength
+            rank = hand_rank([RANK_CHARS[r] + SUIT_CHARS[0] for r in ranks])
+            flushes[mask] = rank_to_strength(rank)
+            ranks_of[flushes[mask]] = rank
+        else:
+            product = 1
+            for r in ranks:
+                product *= PRIMES[r]
+            paired[product] = strength
+
+    return flushes, unique5, paired, ranks_of
+
+
+FLUSHES, UNIQUE5, PAIRED, STRENGTH_RANKS = _build_tables()
+
+# стриты от старшего к младшему (A-5 - младший) в виде масок рангов
+STRAIGHT_MASKS = [0b11111 << i for i in range(8, -1, -1)] + [0b1000000001111]
+
+
+def _build_mask_tables():
+    popcount = [bin(m).count('1') for m in range(1 << 13)]
+    straight = [next((s for s in STRAIGHT_MASKS if m & s == s), 0) for m in range(1 << 13)]
+    top5 = []
+    for m in range(1 << 13):
+        # 5 старших рангов маски
+        while popcount[m] > 5:
+            m &= m - 1  # сброс младшего бита
+        top5.append(m)
+    return popcount, straight, top5
+
+
+POPCOUNT, STRAIGHTS, TOP5 = _build_mask_tables()
+
+
+def eval5(c1, c2, c3, c4, c5):
+    """Сила руки из 5ти карт, заданных кодами"""
+    mask = CARD_BITS[c1] | CARD_BITS[c2] | CARD_BITS[c3] | CARD_BITS[c4] | CARD_BITS[c5]
+    if (c1 & 3) == (c2 & 3) == (c3 & 3) == (c4 & 3) == (c5 & 3):
+        return FLUSHES[mask]
+    strength = UNIQUE5[mask]
+    if strength:
+        return strength
+    return PAIRED[CARD_PRIMES[c1] * CARD_PRIMES[c2] * CARD_PRIMES[c3] * CARD_PRIMES[c4] * CARD_PRIMES[c5]]
+
+
+def fast_hand_rank(hand):
+    """Сила руки из 5ти карт, заданных строками ('AS', 'TD', ...).
+    Порядок сил совпадает с порядком poker.hand_rank"""
+    return eval5(*[CARD_CODES[c] for c in hand])
+
+
+def strength_to_rank(strength):
+    """Кортеж poker.hand_rank по силе руки"""
+    return STRENGTH_RANKS[strength]
+
+
+def top_ranks(mask, n):
+    """n старших рангов из маски"""
+    ranks = []
+    r = 12
+    while len(ranks) < n:
+        if mask & (1 << r):
+            ranks.append(r)
+        r -= 1
+    return ranks
+
+
+def _select7(cards):
+    """Выбор лучшей пятерки из 7ми (или 5..7) карт.
+
+    Возвращает (сила, список пар (ранг, количество карт), масть флеша или None).
+    При флеше в 7ми картах не может быть каре или фулл-хауса, поэтому
+    флеш проверяется первым.
+    """
+    counts = [0] * 13
+    suit_masks = [0, 0, 0, 0]
+    for c in cards:
+        counts[c >> 2] += 1
+        suit_masks[c & 3] |= CARD_BITS[c]
+    return select_best(counts, suit_masks)
+
+
+def select_best(counts, suit_masks):
+    """То же, что _select7, по готовым счетчикам рангов и маскам рангов мастей"""
+    for suit, suit_mask in enumerate(suit_masks):
+        if POPCOUNT[suit_mask] >= 5:
+            mask = STRAIGHTS[suit_mask] or TOP5[suit_mask]
+            return FLUSHES[mask], [(r, 1) for r in top_ranks(mask, 5)], suit
+
+    mask = suit_masks[0] | suit_masks[1] | suit_masks[2] | suit_masks[3]
+    quads, trips, pairs = [], [], []
+    for r in range(12, -1, -1):
+        n = counts[r]
+        if n == 4:
+            quads.append(r)
+        elif n == 3:
+            trips.append(r)
+        elif n == 2:
+            pairs.append(r)
+
+    if quads:
+        q = quads[0]
+        chosen = [(q, 4)] + [(r, 1) for r in top_ranks(mask & ~(1 << q), 1)]
+    elif trips and (len(trips) > 1 or pairs):
+        t = trips[0]
+        chosen = [(t, 3), (max(trips[1:] + pairs[:1]), 2)]
+    elif STRAIGHTS[mask]:
+        straight = STRAIGHTS[mask]
+        return UNIQUE5[straight], [(r, 1) for r in top_ranks(straight, 5)], None
+    elif trips:
+        t = trips[0]
+        chosen = [(t, 3)] + [(r, 1) for r in top_ranks(mask & ~(1 << t), 2)]
+    elif len(pairs) >= 2:
+        p1, p2 = pairs[:2]
+        chosen = [(p1, 2), (p2, 2)] + [(r, 1) for r in top_ranks(mask & ~(1 << p1) & ~(1 << p2), 1)]
+    elif pairs:
+        p = pairs[0]
+        chosen = [(p, 2)] + [(r, 1) for r in top_ranks(mask & ~(1 << p), 3)]
+    else:
+        top = TOP5[mask]
+        return UNIQUE5[top], [(r, 1) for r in top_ranks(top, 5)], None
+
+    product = 1
+    for r, n in chosen:
+        product *= PRIMES[r] ** n
+    return PAIRED[product], chosen, None
+
+
+def eval7(cards):
+    """Сила лучшей пятерки из 7ми карт, заданных кодами"""
+    return _select7(cards)[0]
+
+
+def best_hand7(hand):
+    """Аналог poker.best_hand: лучшая "рука" из 5ти карт для 7ми карт, заданных строками"""
+    cards = [CARD_CODES[c] for c in hand]
+    _, chosen, suit = _select7(cards)
+    best = []
+    for r, n in chosen:
+        for c in cards:
+            if c >> 2 == r and (suit is None or c & 3 == suit):
+                best.append(c)
+                n -= 1
+                if not n:
+                    break
+    return [CARDS[c] for c in best]
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Инкрементальная оценка руки по улицам (флоп, терн, ривер).
+
+HandState хранит счетчики рангов, количество карт и маски рангов по мастям,
+общую маску рангов и гистограмму счетчиков (сколько рангов встречается 1..4
+раза). Добавление карты обновляет состояние за O(1), категория лучшей руки
+определяется по состоянию за O(1) табличными проверками, без пересчета
+card_ranks и kind. Состояние флопа копируется и дополняется картами терна и
+ривера, не пересчитываясь для каждого расклада.
+
+Рассчитано на руки до 7ми карт: при флеше в них нет каре и фулл-хауса.
+"""
+from homeworks.lesson01.poker.evaluator import CARD_BITS, CARD_CODES, CARDS, STRAIGHTS, select_best
+
+MAX_CARDS = 7
+CATEGORY_NAMES = ('high card', 'pair', 'two pair', 'three of a kind', 'straight', 'flush', 'full house',
+                  'four of a kind', 'straight flush')
+
+
+class HandState(object):
+    """Состояние руки, пополняемое по одной карте"""
+
+    __slots__ = ('cards', 'counts', 'suit_counts', 'suit_masks', 'mask', 'kinds')
+
+    def __init__(self, cards=()):
+        self.cards = []
+        self.counts = [0] * 13
+        self.suit_counts = [0, 0, 0, 0]
+        self.suit_masks = [0, 0, 0, 0]
+        self.mask = 0  # маска рангов всех карт, по ней ищутся стриты
+        self.kinds = [13, 0, 0, 0, 0]  # количество рангов, встречающихся 0..4 раза
+        for c in cards:
+            self.add_card(c)
+
+    @classmethod
+    def from_hand(cls, hand):
+        """Состояние по картам-строкам ('AS', 'TD', ...)"""
+        return cls(CARD_CODES[c] for c in hand)
+
+    def copy(self):
+        state = HandState.__new__(HandState)
+        state.cards = self.cards[:]
+        state.counts = self.counts[:]
+        state.suit_counts = self.suit_counts[:]
+        state.suit_masks = self.suit_masks[:]
+        state.mask = self.mask
+        state.kinds = self.kinds[:]
+        return state
+
+    def add_card(self, card):
+        """Добавляет карту (код или строку) за O(1)"""
+        if isinstance(card, str):
+            card = CARD_CODES[card]
+        if len(self.cards) >= MAX_CARDS:
+            raise ValueError(f'В руке не более {MAX_CARDS} карт')
+        if card in self.cards:
+            raise ValueError(f'Карта {CARDS[card]} уже в руке')
+        r, suit = card >> 2, card & 3
+        n = self.counts[r]
+        self.kinds[n] -= 1
+        self.kinds[n + 1] += 1
+        self.counts[r] = n + 1
+        self.suit_counts[suit] += 1
+        self.suit_masks[suit] |= CARD_BITS[card]
+        self.mask |= CARD_BITS[card]
+        self.cards.append(card)
+        return self
+
+    def remove_card(self, card):
+        """Убирает карту (код или строку) - для перебора раскладов с возвратом"""
+        if isinstance(card, str):
+            card = CARD_CODES[card]
+        self.cards.remove(card)
+        r, suit = card >> 2, card & 3
+        n = self.counts[r]
+        self.kinds[n] -= 1
+        self.kinds[n - 1] += 1
+        self.counts[r] = n - 1
+        self.suit_counts[suit] -= 1
+        self.suit_masks[suit] &= ~CARD_BITS[card]
+        if n == 1:
+            self.mask &= ~CARD_BITS[card]
+        return self
+
+    def flush_suit(self):
+        """Масть флеша или None"""
+        for suit in range(4):
+            if self.suit_counts[suit] >= 5:
+                return suit
+        return None
+
+    def category(self):
+        """Категория лучшей руки из имеющихся карт: 0 - старшая карта .. 8 - стрит-флеш.
+        Для неполной руки (меньше 5ти карт) - категория уже собранной комбинации"""
+        suit = self.flush_suit()
+        if suit is not None:
+            return 8 if STRAIGHTS[self.suit_masks[suit]] else 5
+        kinds = self.kinds
+        if kinds[4]:
+            return 7
+        if kinds[3] and (kinds[3] > 1 or kinds[2]):
+            return 6
+        if STRAIGHTS[self.mask]:
+            return 4
+        if kinds[3]:
+            return 3
+        if kinds[2] > 1:
+            return 2
+        if kinds[2]:
+            return 1
+        return 0
+
+    def strength(self):
+        """Сила лучшей пятерки (как evaluator.eval7) для 5..7 карт"""
+        if len(self.cards) < 5:
+            raise ValueError('Для оценки нужно не менее 5ти карт')
+        return select_best(self.counts, self.suit_masks)[0]
+
+    def outs(self, deck):
+        """Карты deck (кроме уже имеющихся в руке), повышающие категорию руки"""
+        current = self.category()
+        result = []
+        for c in deck:
+            if c in self.cards:
+                continue
+            if self.add_card(c).category() > current:
+                result.append(c)
+            self.remove_card(c)
+        return result
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __repr__(self):
+        return f'HandState({" ".join(CARDS[c] for c in self.cards)}: {CATEGORY_NAMES[self.category()]})'
@@ -26,6 +26,7 @@
 # Вам наверняка пригодится itertools.
 # Можно свободно определять свои функции и т.п.
 # -----------------
+import itertools
 
 
 def hand_rank(hand):
@@ -51,43 +52,62 @@ def hand_rank(hand):
         return (0, ranks)
 
 
+RANKS = '--23456789TJQKA'  # индекс в строке - числовой ранг карты
+
+
 def card_ranks(hand):
     """Возвращает список рангов (его числовой эквивалент),
     отсортированный от большего к меньшему"""
-    return
+    ranks = sorted((RANKS.index(r) for r, s in hand), reverse=True)
+    # туз в младшем стрите (A-5) играет как единица
+    return [5, 4, 3, 2, 1] if ranks == [14, 5, 4, 3, 2] else ranks
 
 
 def flush(hand):
     """Возвращает True, если все карты одной масти"""
-    return
+    return len({s for r, s in hand}) == 1
 
 
 def straight(ranks):
     """Возвращает True, если отсортированные ранги формируют последовательность 5ти,
     где у 5ти карт ранги идут по порядку (стрит)"""
-    return
+    return len(set(ranks)) == 5 and ranks[0] - ranks[-1] == 4
 
 
 def kind(n, ranks):
     """Возвращает первый ранг, который n раз встречается в данной руке.
     Возвращает None, если ничего не найдено"""
-    return
+    for r in ranks:
+        if ranks.count(r) == n:
+            return r
+    return None
 
 
 def two_pair(ranks):
     """Если есть две пары, то возврщает два соответствующих ранга,
     иначе возвращает None"""
-    return
+    pair = kind(2, ranks)
+    low_pair = kind(2, list(reversed(ranks)))
+    if pair and low_pair != pair:
+        return pair, low_pair
+    return None
 
 
 def best_hand(hand):
     """Из "руки" в 7 карт возвращает лучшую "руку" в 5 карт """
-    return
+    return list(max(itertools.combinations(hand, 5), key=hand_rank))
+
+
+JOKERS = {'?B': 'CS', '?R': 'HD'}  # джокер -> масти, которые он может заменить
 
 
 def best_wild_hand(hand):
     """best_hand но с джокерами"""
-    return
+    # джокер перебирает все карты своего цвета, кроме уже имеющихся в руке
+    options = [[r + s for r in RANKS[2:] for s in JOKERS[c] if r + s not in hand] if c in JOKERS else [c]
+               for c in hand]
+    hands = (h for h in itertools.product(*options) if len(set(h)) == len(h))
+    return max((best_hand(h) for h in hands), key=hand_rank)
 
 
 def test_best_hand():
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Таблица префлоп эквити 169 x 169 классов стартовых рук.
+
+Класс руки - пара ('AA'), одномастные ('AKs') или разномастные ('AKo') карты,
+классы упорядочены по сетке 13 x 13: строка и столбец - ранги от туза к двойке,
+на диагонали пары, выше диагонали одномастные, ниже - разномастные.
+
+Таблица считается один раз генератором (Монте-Карло по комбинациям классов и
+бордам, в пуле процессов) и сохраняется в двоичный файл: заголовок и матрица
+float32. При импорте файл отображается в память (mmap), поэтому поиск не требует
+ни расчета, ни чтения файла целиком.
+
+Генерация:
+    python -m homeworks.lesson01.poker.preflop --samples 2000
+"""
+import argparse
+import concurrent.futures
+import itertools
+import mmap
+import os
+import random
+import struct
+import time
+
+from homeworks.lesson01.poker.evaluator import CARD_CODES, RANK_CHARS, SUIT_CHARS, eval7
+
+EQUITY_FILE = os.path.join(os.path.dirname(__file__), 'preflop.bin')
+MAGIC = b'PFEQ'
+HEADER = struct.Struct('<4sHI')  # сигнатура, количество классов, раздач на пару классов
+VALUE = struct.Struct('<f')
+DEFAULT_SAMPLES = 2000  # раздач на пару классов
+
+RANKS_DESC = RANK_CHARS[::-1]
+HAND_CLASSES = [
+    RANKS_DESC[min(i, j)] + RANKS_DESC[max(i, j)] + ('' if i == j else 's' if i < j else 'o')
+    for i in range(13) for j in range(13)
+]
+CLASS_INDEX = {name: n for n, name in enumerate(HAND_CLASSES)}
+
+
+def hand_class(hole):
+    """Класс стартовой руки по двум картам-строкам"""
+    (r1, s1), (r2, s2) = sorted(hole, key=lambda c: RANKS_DESC.index(c[0]))
+    if r1 == r2:
+        return r1 + r2
+    return r1 + r2 + ('s' if s1 == s2 else 'o')
+
+
+def class_combos(name):
+    """Все комбинации карт класса в виде пар кодов"""
+    r1, r2 = name[0], name[1]
+    if r1 == r2:
+        return [(CARD_CODES[r1 + a], CARD_CODES[r2 + b]) for a, b in itertools.combinations(SUIT_CHARS, 2)]
+    if name[2] == 's':
+        return [(CARD_CODES[r1 + s], CARD_CODES[r2 + s]) for s in SUIT_CHARS]
+    return [(CARD_CODES[r1 + a], CARD_CODES[r2 + b]) for a in SUIT_CHARS for b in SUIT_CHARS if a != b]
+
+
+def _row(i, samples, seed):
+    """Эквити класса i против классов j >= i"""
+    rnd = random.Random(f'{seed}-{i}')
+    deck = list(range(52))
+    hero_combos = class_combos(HAND_CLASSES[i])
+    row = {i: .5}  # класс против себя - симметричная ситуация
+    for j in range(i + 1, len(HAND_CLASSES)):
+        villain_combos = class_combos(HAND_CLASSES[j])
+        total = 0.
+        n = 0
+        while n < samples:
+            hero = rnd.choice(hero_combos)
+            villain = rnd.choice(villain_combos)
+            if hero[0] in villain or hero[1] in villain:
+                continue
+            known = hero + villain
+            board = []
+            while len(board) < 5:
+                c = rnd.choice(deck)
+                if c not in known and c not in board:
+                    board.append(c)
+            a, b = eval7(list(hero) + board), eval7(list(villain) + board)
+            total += 1. if a > b else .5 if a == b else 0.
+            n += 1
+        row[j] = total / samples
+    return i, row
+
+
+def generate(path=EQUITY_FILE, samples=DEFAULT_SAMPLES, workers=None, seed=0):
+    """Расчет таблицы в пуле процессов и запись в файл path"""
+    size = len(HAND_CLASSES)
+    matrix = [0.] * (size * size)
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(_row, i, samples, seed) for i in range(size)]
+        for future in concurrent.futures.as_completed(futures):
+            i, row = future.result()
+            for j, value in row.items():
+                matrix[i * size + j] = value
+                matrix[j * size + i] = 1. - value
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as fp:
+        fp.write(HEADER.pack(MAGIC, size, samples))
+        fp.write(struct.pack(f'<{size * size}f', *matrix))
+    os.replace(tmp_path, path)
+
+
+def load(path=EQUITY_FILE):
+    """Отображает файл таблицы в память. None - если файла нет или он не той структуры"""
+    try:
+        with open(path, 'rb') as fp:
+            mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):  # ValueError - пустой файл
+        return None
+    size = len(HAND_CLASSES)
+    if len(mm) != HEADER.size + size * size * VALUE.size or HEADER.unpack_from(mm)[:2] != (MAGIC, size):
+        mm.close()
+        return None
+    return mm
+
+
+_table = load()
+
+
+def preflop_equity(hero, villain, table=None):
+    """Префлоп эквити hero против villain.
+    Руки задаются классами ('AKs') или двумя картами (['AS', 'KS'])"""
+    table = table or _table
+    if table is None:
+        raise FileNotFoundError(f'Нет таблицы {EQUITY_FILE}, необходимо выполнить генерацию')
+    i = CLASS_INDEX[hero if isinstance(hero, str) else hand_class(hero)]
+    j = CLASS_INDEX[villain if isinstance(villain, str) else hand_class(villain)]
+    return VALUE.unpack_from(table, HEADER.size + (i * len(HAND_CLASSES) + j) * VALUE.size)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='preflop.py')
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help='Раздач на пару классов')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=EQUITY_FILE)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    generate(args.output, args.samples, args.workers, args.seed)
+    print(f'{args.output}: {time.perf_counter() - start:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,360 @@
+import itertools
+import os
+import random
+import tempfile
+import unittest
+
+from homeworks.lesson01.poker import benchmark, canonical, preflop
+from homeworks.lesson01.poker.equity import canonical_cards, equity, exact_equity, suit_symmetries
+from homeworks.lesson01.poker.evaluator import (CARDS, STRENGTH_RANKS, best_hand7, decode_hand, encode_hand, eval5,
+                                                eval7, fast_hand_rank, rank_to_strength, strength_category,
+                                                strength_to_rank)
+from homeworks.lesson01.poker.incremental import HandState
+from homeworks.lesson01.poker.poker import best_hand, best_wild_hand, hand_rank
+from homeworks.lesson01.poker.wild import JOKER_SUITS, best_wild_hand7
+
+try:
+    import numpy
+
+    from homeworks.lesson01.poker.batch import rank_hands
+except ImportError:  # numpy опционален
+    numpy = None
+
+SEED = 2022
+
+
+def cmp(a, b):
+    return (a > b) - (a < b)
+
+
+class TestHandRank(unittest.TestCase):
+    """"""
+
+    def test_hand_rank(self):
+        fixtures = [
+            ("6C 7C 8C 9C TC", (8, 10)),
+            ("AC 2C 3C 4C 5C", (8, 5)),
+            ("9D 9H 9S 9C 7D", (7, 9, 7)),
+            ("TD TC TH 7C 7D", (6, 10, 7)),
+            ("2C 7C 9C JC KC", (5, [13, 11, 9, 7, 2])),
+            ("AD 2C 3H 4S 5C", (4, 5)),
+            ("TD TC TH 7C 8D", (3, 10, [10, 10, 10, 8, 7])),
+            ("TD TC 7H 7C 8D", (2, (10, 7), [10, 10, 8, 7, 7])),
+            ("TD TC 6H 7C 8D", (1, 10, [10, 10, 8, 7, 6])),
+            ("AD QC 6H 7C 8D", (0, [14, 12, 8, 7, 6])),
+        ]
+        for hand, expected in fixtures:
+            self.assertEqual(hand_rank(hand.split()), expected)
+
+
+class TestEvaluator(unittest.TestCase):
+    """"""
+
+    def test_encoding(self):
+        self.assertEqual(len(set(CARDS)), 52)
+        hand = "AS TD 2C 7H QD".split()
+        self.assertListEqual(decode_hand(encode_hand(hand)), hand)
+
+    def test_rank_to_strength(self):
+        ranks = sorted(hand_rank(random.Random(SEED).sample(CARDS, 5)) for _ in range(10))
+        for a, b in itertools.combinations(ranks, 2):
+            self.assertEqual(cmp(a, b), cmp(rank_to_strength(a), rank_to_strength(b)))
+
+    def test_fast_hand_rank(self):
+        rnd = random.Random(SEED)
+        hands = [rnd.sample(CARDS, 5) for _ in range(20000)]
+        for hand in hands:
+            rank = hand_rank(hand)
+            strength = fast_hand_rank(hand)
+            self.assertEqual(strength_to_rank(strength), rank, hand)
+            self.assertEqual(strength_category(strength), rank[0])
+            self.assertEqual(eval5(*encode_hand(hand)), strength)
+
+        # порядок сил совпадает с порядком кортежей hand_rank
+        for a, b in zip(hands, hands[1:]):
+            self.assertEqual(cmp(hand_rank(a), hand_rank(b)), cmp(fast_hand_rank(a), fast_hand_rank(b)))
+
+    def test_best_hand(self):
+        fixtures = [
+            ("6C 7C 8C 9C TC 5C JS", ['6C', '7C', '8C', '9C', 'TC']),
+            ("TD TC TH 7C 7D 8C 8S", ['8C', '8S', 'TC', 'TD', 'TH']),
+            ("JD TC TH 7C 7D 7S 7H", ['7C', '7D', '7H', '7S', 'JD']),
+            ("AD 2C 3H 4S 5C 9D 9H", ['2C', '3H', '4S', '5C', 'AD']),
+            ("AD AC AH KS KC QD 2H", ['AC', 'AD', 'AH', 'KC', 'KS']),
+        ]
+        for hand, expected in fixtures:
+            self.assertListEqual(sorted(best_hand(hand.split())), expected)
+            self.assertListEqual(sorted(best_hand7(hand.split())), expected)
+
+    def test_eval7(self):
+        rnd = random.Random(SEED)
+        for _ in range(5000):
+            hand = rnd.sample(CARDS, 7)
+            expected = max(eval5(*c) for c in itertools.combinations(encode_hand(hand), 5))
+            self.assertEqual(eval7(encode_hand(hand)), expected, hand)
+            best = best_hand7(hand)
+            self.assertEqual(len(set(best)), 5)
+            self.assertTrue(set(best) <= set(hand))
+            self.assertEqual(fast_hand_rank(best), expected, hand)
+
+        for _ in range(500):
+            hand = rnd.sample(CARDS, 7)
+            self.assertEqual(hand_rank(best_hand(hand)), strength_to_rank(eval7(encode_hand(hand))))
+
+    def test_all_classes(self):
+        # 7462 класса эквивалентности рук из 5ти карт
+        self.assertEqual(len(STRENGTH_RANKS), 7462)
+
+
+def wild_oracle(hand):
+    """Полный перебор замен джокеров с оценкой eval7"""
+    real = [c for c in hand if c not in JOKER_SUITS]
+    options = [[r + s for r in '23456789TJQKA' for s in 'CSHD' if 'CSHD'.index(s) in JOKER_SUITS[c] and r + s not in real]
+               for c in hand if c in JOKER_SUITS]
+    return max(eval7(encode_hand(real + list(subst)))
+               for subst in itertools.product(*options) if len(set(subst)) == len(subst))
+
+
+class TestWild(unittest.TestCase):
+    """"""
+
+    def test_best_wild_hand(self):
+        fixtures = [
+            ("6C 7C 8C 9C TC 5C ?B", ['7C', '8C', '9C', 'JC', 'TC']),
+            ("TD TC 5H 5C 7C ?R ?B", ['7C', 'TC', 'TD', 'TH', 'TS']),
+            ("JD TC TH 7C 7D 7S 7H", ['7C', '7D', '7H', '7S', 'JD']),
+        ]
+        for hand, expected in fixtures:
+            self.assertListEqual(sorted(best_wild_hand(hand.split())), expected)
+            self.assertListEqual(sorted(best_wild_hand7(hand.split())), expected)
+
+    def test_property(self):
+        # на случайных руках результат совпадает с полным перебором
+        rnd = random.Random(SEED)
+        for n in range(3000):
+            jokers = [['?B'], ['?R'], ['?B', '?R']][n % 3]
+            hand = rnd.sample(CARDS, 7 - len(jokers)) + jokers
+            rnd.shuffle(hand)
+            best = best_wild_hand7(hand)
+            self.assertEqual(len(set(best)), 5, hand)
+            self.assertLessEqual(len(set(best) - set(hand)), len(jokers), hand)
+            self.assertEqual(fast_hand_rank(best), wild_oracle(hand), hand)
+
+        for _ in range(5):
+            hand = rnd.sample(CARDS, 6) + ['?R']
+            self.assertEqual(hand_rank(best_wild_hand(hand)), hand_rank(best_wild_hand7(hand)), hand)
+
+
+class TestEquity(unittest.TestCase):
+    """"""
+
+    def test_equity(self):
+        result = equity([['AS', 'AD'], ['KS', 'KH']], samples=20000, precision=0, workers=1, seed=SEED, chunk=5000)
+        self.assertEqual(result[0].samples, 20000)
+        self.assertAlmostEqual(result[0].equity, 0.82, delta=0.02)
+        self.assertAlmostEqual(result[0].equity + result[1].equity, 1.)
+        self.assertLess(result[0].interval, 0.01)
+        self.assertGreater(result[0].rate, 0)
+
+        # результат не зависит от количества процессов
+        parallel = equity([['AS', 'AD'], ['KS', 'KH']], samples=20000, precision=0, workers=2, seed=SEED, chunk=5000)
+        self.assertListEqual([r.equity for r in parallel], [r.equity for r in result])
+
+        # известный исход: симуляция останавливается на первой пачке
+        result = equity([['AS', 'AD'], ['KS', 'KH'], ['QS', 'QH']], board='AC 2D 7H 9S TC'.split(), workers=1,
+                        chunk=100)
+        self.assertEqual(result[0].samples, 100)
+        self.assertListEqual([r.win for r in result], [1., 0., 0.])
+
+        # ничья, джокер
+        result = equity([['2S', '3S'], ['2D', '3D'], ['?B', '4S']], board='AC KD QH JS TC'.split(), workers=1,
+                        chunk=100)
+        self.assertListEqual([r.tie for r in result], [1., 1., 1.])
+        self.assertAlmostEqual(result[0].equity, 1 / 3)
+
+        with self.assertRaises(ValueError):
+            equity([['AS', 'AD'], ['AS', 'KH']])
+
+    def test_exact_equity(self):
+        # ривер: исход известен
+        result = exact_equity([['AS', 'AD'], ['KS', 'KH']], 'AC 2D 7H 9S TC'.split())
+        self.assertListEqual([r.win for r in result], [1., 0.])
+        self.assertEqual(result[0].samples, 1)
+
+        # терн: 44 ривера, проверка полным перебором через showdown
+        players = [['AS', 'AD'], ['KS', 'KH']]
+        board = '2C 7H 9D KC'.split()
+        rivers = [c for c in CARDS if c not in board + players[0] + players[1]]
+        wins = sum(hand_rank(best_hand(players[0] + board + [c])) > hand_rank(best_hand(players[1] + board + [c]))
+                   for c in rivers)
+        result = exact_equity(players, board)
+        self.assertEqual(result[0].samples, 44)
+        self.assertAlmostEqual(result[0].win, wins / 44)
+
+        # флоп: учет равноправных мастей (H и D не встречаются) не меняет результат
+        players = [['AS', 'AC'], ['KS', 'KC']]
+        board = '2S 7C 9S'.split()
+        self.assertEqual(len(suit_symmetries([set(encode_hand(h)) for h in players] + [set(encode_hand(board))])), 2)
+        full = exact_equity(players, board, symmetric=False)
+        cache = {}
+        reduced = exact_equity(players, board, cache=cache)
+        self.assertEqual(full[0].samples, reduced[0].samples)
+        for a, b in zip(full, reduced):
+            self.assertAlmostEqual(a.equity, b.equity)
+            self.assertAlmostEqual(a.tie, b.tie)
+        self.assertLess(len(cache), 1081)  # бордов вычислено меньше, чем раскладов
+
+        # кэш бордов переиспользуется для другого соперника с тем же героем
+        exact_equity([['AS', 'AC'], ['QS', 'QC']], board, cache=cache)
+        self.assertTrue(all(len(hands) <= 3 for hands in cache.values()))
+
+        perms = suit_symmetries([{0, 1}])  # 2C 2S: можно менять местами C-S и H-D
+        self.assertEqual(len(perms), 4)
+        self.assertEqual(canonical_cards(encode_hand(['AH', 'KD']), perms), canonical_cards(encode_hand(['AD', 'KH']), perms))
+
+
+class TestCanonical(unittest.TestCase):
+    """"""
+
+    def test_canonical_key(self):
+        key = canonical.canonical_key
+        self.assertEqual(key('AS KS QD JC 2H'.split()), key('AH KH QC JD 2S'.split()))
+        self.assertNotEqual(key('AS KS QD JC 2H'.split()), key('AS KD QD JC 2H'.split()))
+        # джокеры: масти переставляются внутри цвета и цвета целиком вместе с джокером
+        self.assertEqual(key('AS KS QD JC ?B'.split()), key('AC KC QH JS ?B'.split()))
+        self.assertEqual(key('AS KS QD JC ?B'.split()), key('AH KH QC JD ?R'.split()))
+        self.assertNotEqual(key('AS KS QD JC ?B'.split()), key('AS KS QD JC ?R'.split()))
+
+    def test_cached_strength(self):
+        canonical.cache_clear()
+        rnd = random.Random(SEED)
+        for n in range(2000):
+            hand = rnd.sample(CARDS, 7 - n % 2) + ['?R'] * (n % 2)
+            self.assertEqual(canonical.cached_strength(hand), wild_oracle(hand) if n % 2 else eval7(encode_hand(hand)))
+            # та же рука с переставленными мастями берется из кэша
+            perm = str.maketrans('CSHD', 'SCDH')
+            self.assertEqual(canonical.cached_strength([c.translate(perm) for c in hand]),
+                             canonical.cached_strength(hand))
+        info = canonical.cache_info()
+        self.assertEqual(info.hits + info.misses, 6000)
+        self.assertLessEqual(info.misses, 2000)
+        self.assertGreaterEqual(canonical.hit_ratio(), .5)
+
+
+class TestIncremental(unittest.TestCase):
+    """"""
+
+    def test_streets(self):
+        rnd = random.Random(SEED)
+        for _ in range(2000):
+            cards = rnd.sample(range(52), 7)
+            state = HandState(cards[:5])  # флоп
+            for n in (5, 6, 7):  # флоп, терн, ривер
+                if n > 5:
+                    state.add_card(cards[n - 1])
+                self.assertEqual(state.strength(), eval7(cards[:n]))
+                self.assertEqual(state.category(), strength_category(eval7(cards[:n])))
+
+            # возврат к флопу восстанавливает состояние
+            flop = HandState(cards[:5])
+            state.remove_card(cards[6]).remove_card(cards[5])
+            self.assertEqual([state.counts, state.suit_masks, state.mask, state.kinds],
+                             [flop.counts, flop.suit_masks, flop.mask, flop.kinds])
+
+        state = HandState.from_hand('6C 7C 8C 9C'.split())
+        self.assertEqual(state.category(), 0)
+        turn = state.copy().add_card('TC')
+        self.assertEqual(turn.category(), 8)
+        self.assertEqual(len(state), 4)
+        self.assertEqual(state.add_card('6D').category(), 1)
+        self.assertEqual(state.add_card('6H').category(), 3)
+        self.assertEqual(state.copy().add_card('7D').category(), 6)
+        self.assertEqual(state.add_card('6S').category(), 7)
+        with self.assertRaises(ValueError):
+            state.add_card('AS')  # восьмая карта
+        with self.assertRaises(ValueError):
+            state.remove_card('6S').add_card('6C')  # карта уже в руке
+
+        # ауты к стриту: 5 и T, к флешу - трефы
+        state = HandState.from_hand('6C 7C 8C 9D 2C'.split())
+        outs = set(decode_hand(state.outs(range(52))))
+        self.assertTrue({'5D', 'TD', '4C', 'AC'} <= outs)
+        self.assertNotIn('AD', outs)
+
+
+class TestBenchmark(unittest.TestCase):
+    """"""
+
+    def test_run(self):
+        corpus = benchmark.make_corpus(hands=300, wild=4, seed=SEED)
+        self.assertEqual(corpus, benchmark.make_corpus(hands=300, wild=4, seed=SEED))
+        self.assertEqual([len(corpus[k]) for k in ('hand5', 'hand7', 'wild')], [300, 300, 4])
+        self.assertTrue(all(len(set(h)) == len(h) for hands in corpus.values() for h in hands))
+
+        results = benchmark.run(corpus)
+        self.assertGreaterEqual(len(results), len(benchmark.CASES) - (numpy is None))
+        for r in results:
+            self.assertListEqual(r.mismatches, [], r.name)
+            self.assertGreater(r.fast_rate, 0)
+
+
+@unittest.skipIf(numpy is None, 'numpy не установлен')
+class TestBatch(unittest.TestCase):
+    """"""
+
+    def test_rank_hands(self):
+        rng = numpy.random.default_rng(SEED)
+        for n in (5, 6, 7):
+            hands = numpy.argsort(rng.random((5000, 52)), axis=1)[:, :n]  # n разных карт в каждой руке
+            result = rank_hands(hands)
+            self.assertEqual(result.shape, (5000,))
+            expected = [eval5(*h) if n == 5 else eval7(h) for h in hands.tolist()]
+            self.assertListEqual(result.tolist(), expected)
+
+        # стрит-флеш и каре
+        hands = [encode_hand("6C 7C 8C 9C TC 5C JS".split()), encode_hand("JD TC TH 7C 7D 7S 7H".split())]
+        self.assertListEqual(rank_hands(hands).tolist(), [eval7(h) for h in hands])
+
+        with self.assertRaises(ValueError):
+            rank_hands([[0, 1, 2, 3]])
+
+
+class TestPreflop(unittest.TestCase):
+    """"""
+
+    def test_hand_classes(self):
+        self.assertEqual(len(preflop.HAND_CLASSES), 169)
+        self.assertEqual(preflop.HAND_CLASSES[:3], ['AA', 'AKs', 'AQs'])
+        self.assertEqual(preflop.HAND_CLASSES[13], 'AKo')
+        self.assertEqual(preflop.hand_class(['KS', 'AS']), 'AKs')
+        self.assertEqual(preflop.hand_class(['AD', 'KS']), 'AKo')
+        self.assertEqual(preflop.hand_class(['7D', '7S']), '77')
+        self.assertEqual([len(preflop.class_combos(c)) for c in ('AA', 'AKs', 'AKo')], [6, 4, 12])
+        self.assertEqual(sum(len(preflop.class_combos(c)) for c in preflop.HAND_CLASSES), 1326)
+
+    def test_generate(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'preflop.bin')
+            self.assertIsNone(preflop.load(path))
+            preflop.generate(path, samples=20, workers=2, seed=SEED)
+            table = preflop.load(path)
+            self.assertIsNotNone(table)
+            try:
+                self.assertEqual(preflop.preflop_equity('AKs', 'AKs', table), .5)
+                for a, b in (('AA', '72o'), ('QJs', 'T9o'), ('22', 'AKs')):
+                    self.assertAlmostEqual(preflop.preflop_equity(a, b, table) + preflop.preflop_equity(b, a, table),
+                                           1., places=6)
+                self.assertEqual(preflop.preflop_equity(['AS', 'AD'], ['7C', '2H'], table),
+                                 preflop.preflop_equity('AA', '72o', table))
+                aces = [preflop.preflop_equity('AA', c, table) for c in preflop.HAND_CLASSES[1:]]
+                self.assertGreater(sum(aces) / len(aces), .75)
+            finally:
+                table.close()
+
+            with open(path, 'r+b') as fp:  # поврежденный файл не загружается
+                fp.write(b'XXXX')
+            self.assertIsNone(preflop.load(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Лучшая рука с джокерами без перебора всех замен.
+
+Категории рук проверяются от старшей (стрит-флеш) к младшей, внутри категории
+варианты рангов перебираются по убыванию силы. Первый вариант, который можно
+собрать из карт руки и джокеров, и есть лучшая рука. Большинство вариантов
+отсекается сразу по счетчикам рангов: джокеров не хватает на недостающие карты.
+"""
+import itertools
+
+from homeworks.lesson01.poker.evaluator import (CARD_BITS, CARD_CODES, POPCOUNT, STRAIGHT_MASKS, best_hand7,
+                                                decode_hand, top_ranks)
+
+JOKER_SUITS = {'?B': (0, 1), '?R': (2, 3)}  # джокер -> коды мастей, которые он может заменить
+RANKS_DESC = tuple(range(12, -1, -1))
+
+
+def _realize(slots, by_rank, jokers, in_hand):
+    """Собирает руку по слотам (ранг, количество, масть или None).
+
+    Слоты заполняются сначала картами руки, недостающие карты - джокерами.
+    Возвращает коды 5ти карт или None, если руку собрать нельзя.
+    """
+    used, need = [], []
+    for r, n, suit in slots:
+        avail = [c for c in by_rank[r] if suit is None or c & 3 == suit][:n]
+        used.extend(avail)
+        need.extend([(r, suit)] * (n - len(avail)))
+    if not need:
+        return used
+    if len(need) > len(jokers):
+        return None
+
+    for perm in itertools.permutations(jokers, len(need)):
+        subst = []
+        for (r, suit), suits in zip(need, perm):
+            card = next((r * 4 + s for s in suits
+                         if (suit is None or s == suit) and r * 4 + s not in in_hand and r * 4 + s not in subst),
+                        None)
+            if card is None:
+                break
+            subst.append(card)
+        else:
+            return used + subst
+    return None
+
+
+def _candidates(counts, suit_masks, jokers):
+    """Варианты рук в виде слотов по убыванию силы, отсеянные по счетчикам рангов"""
+    k = len(jokers)
+
+    def short(*slots):  # сколько карт не хватает до слотов
+        return sum(max(0, n - counts[r]) for r, n in slots)
+
+    # стрит-флеш
+    for mask in STRAIGHT_MASKS:
+        for suit in range(4):
+            wild = sum(suit in suits for suits in jokers)
+            if POPCOUNT[mask & ~suit_masks[suit]] <= wild:
+                yield [(r, 1, suit) for r in top_ranks(mask, 5)]
+    # каре
+    for r in RANKS_DESC:
+        if short((r, 4)) <= k:
+            for x in RANKS_DESC:
+                if x != r and short((r, 4), (x, 1)) <= k:
+                    yield [(r, 4, None), (x, 1, None)]
+    # фулл-хаус
+    for t in RANKS_DESC:
+        if short((t, 3)) <= k:
+            for p in RANKS_DESC:
+                if p != t and short((t, 3), (p, 2)) <= k:
+                    yield [(t, 3, None), (p, 2, None)]
+    # флеш: в каждой масти к картам добавляются старшие недостающие ранги
+    flushes = []
+    for suit in range(4):
+        mask = suit_masks[suit]
+        for _ in range(sum(suit in suits for suits in jokers)):
+            mask |= 1 << next(r for r in RANKS_DESC if not mask & (1 << r))
+        if POPCOUNT[mask] >= 5:
+            flushes.append((top_ranks(mask, 5), suit))
+    for ranks, suit in sorted(flushes, reverse=True):
+        yield [(r, 1, suit) for r in ranks]
+    # стрит
+    for mask in STRAIGHT_MASKS:
+        ranks = top_ranks(mask, 5)
+        if short(*((r, 1) for r in ranks)) <= k:
+            yield [(r, 1, None) for r in ranks]
+    # тройка
+    for t in RANKS_DESC:
+        if short((t, 3)) <= k:
+            for kickers in itertools.combinations([r for r in RANKS_DESC if r != t], 2):
+                if short((t, 3), *((x, 1) for x in kickers)) <= k:
+                    yield [(t, 3, None)] + [(x, 1, None) for x in kickers]
+    # две пары
+    for h, lo in itertools.combinations(RANKS_DESC, 2):
+        if short((h, 2), (lo, 2)) <= k:
+            for x in RANKS_DESC:
+                if x not in (h, lo) and short((h, 2), (lo, 2), (x, 1)) <= k:
+                    yield [(h, 2, None), (lo, 2, None), (x, 1, None)]
+    # пара
+    for p in RANKS_DESC:
+        if short((p, 2)) <= k:
+            for kickers in itertools.combinations([r for r in RANKS_DESC if r != p], 3):
+                if short((p, 2), *((x, 1) for x in kickers)) <= k:
+                    yield [(p, 2, None)] + [(x, 1, None) for x in kickers]
+    # старшая карта
+    for ranks in itertools.combinations(RANKS_DESC, 5):
+        if short(*((r, 1) for r in ranks)) <= k:
+            yield [(r, 1, None) for r in ranks]
+
+
+def best_wild_hand7(hand):
+    """Аналог poker.best_wild_hand: лучшая "рука" из 5ти карт, джокеры заменены картами"""
+    jokers = [JOKER_SUITS[c] for c in hand if c in JOKER_SUITS]
+    if not jokers:
+        return best_hand7(hand)
+
+    cards = [CARD_CODES[c] for c in hand if c not in JOKER_SUITS]
+    in_hand = set(cards)
+    counts = [0] * 13
+    suit_masks = [0, 0, 0, 0]
+    by_rank = [[] for _ in range(13)]
+    for c in cards:
+        counts[c >> 2] += 1
+        suit_masks[c & 3] |= CARD_BITS[c]
+        by_rank[c >> 2].append(c)
+
+    for slots in _candidates(counts, suit_masks, jokers):
+        best = _realize(slots, by_rank, jokers, in_hand)
+        if best is not None:
+            return decode_hand(best)
+    return None